@@ -1,6 +1,23 @@
-from django.contrib import admin
+import csv
+import io
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Profile
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.http import content_disposition_header
+
+from .models import User, Profile, Skill
+from .roster import FORMATS, RosterImporter, aiter_roster, detect_format, iter_roster, read_roster
+
+
+class RosterImportForm(forms.Form):
+    roster = forms.FileField(label='Файл ростера', help_text='CSV или NDJSON, формат - как у выгрузки')
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -14,15 +31,72 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('role', 'skills', 'about', 'team')
         }),
     )
+    # Состав команды меняют заявки и страницы команды: они же ведут Team.member_count
+    readonly_fields = ('team',)
     
     add_fieldsets = BaseUserAdmin.add_fieldsets + (
         ('Дополнительная информация', {
             'fields': ('email', 'role', 'skills', 'about')
         }),
     )
+    change_list_template = 'admin/accounts/user/change_list.html'
+    
+    def get_urls(self):
+        return [
+            path('roster/import/', self.admin_site.admin_view(self.import_roster), name='accounts_user_import_roster'),
+            path('roster/export/', self.admin_site.admin_view(self.export_roster), name='accounts_user_export_roster'),
+        ] + super().get_urls()
+    
+    def import_roster(self, request):
+        # Импорт создаёт участников и меняет состав команд
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = RosterImportForm(request.POST, request.FILES) if request.method == 'POST' else RosterImportForm()
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['roster']
+            importer = RosterImporter()
+            try:
+                stats = importer.run(read_roster(
+                    io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''), detect_format(upload.name)
+                ))
+            except (ValueError, csv.Error) as e:
+                self.message_user(request, f'Не удалось прочитать ростер: {e}', messages.ERROR)
+            else:
+                self.message_user(
+                    request,
+                    f'Создано участников: {stats["created"]}, пропущено: {stats["skipped"]}, '
+                    f'новых команд: {stats["teams_created"]}, вступили в команды: {stats["joined"]}',
+                )
+                for number, text in importer.errors[:20]:
+                    self.message_user(request, f'запись {number}: {text}' if number else text, messages.WARNING)
+                return redirect('admin:accounts_user_changelist')
+        return TemplateResponse(request, 'admin/accounts/user/import_roster.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Импорт участников',
+        })
+    
+    def export_roster(self, request):
+        # В ростере почты и телефоны: сотруднику без права просмотра - нет
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        format = request.GET.get('format') if request.GET.get('format') in FORMATS else 'csv'
+        response = StreamingHttpResponse(
+            # Под ASGI только асинхронный итератор отдаётся кусками
+            aiter_roster(format) if isinstance(request, ASGIRequest) else iter_roster(format),
+            content_type='text/csv; charset=utf-8' if format == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = content_disposition_header(True, f'roster.{format}')
+        return response
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone', 'github_link', 'telegram_link')
     search_fields = ('user__username', 'user__email')
     list_filter = ('user__role',)
+
+@admin.register(Skill)
+class SkillAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key')
+    search_fields = ('name', 'key')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from accounts.roster import FORMATS, detect_format, iter_roster
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает активных участников с профилями и командами в CSV или NDJSON '
+        'потоком, в формате import_roster (без паролей).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, help='По умолчанию - по расширению --output, иначе csv')
+        parser.add_argument('--output', help='Файл, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        format = options['format'] or detect_format(options['output'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+                stream.writelines(iter_roster(format))
+        else:
+            for line in iter_roster(format):
+                self.stdout.write(line, ending='')
@@ -0,0 +1,41 @@
+import csv
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.roster import FORMATS, RosterImporter, detect_format, read_roster
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует участников из CSV или NDJSON (по строке на участника) '
+        'в User, Profile и Team пачками bulk_create. Колонки: username, password, '
+        'email, first_name, last_name, role, skills, about, phone, github_link, '
+        'telegram_link, team, is_leader. Уже зарегистрированные пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл ростера, - для stdin')
+        parser.add_argument('--format', choices=FORMATS, help='По умолчанию - по расширению файла, иначе csv')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, help='Процессов для хеширования паролей (по умолчанию - ROSTER_HASH_WORKERS)')
+
+    def handle(self, *args, **options):
+        format = options['format'] or detect_format(options['path'])
+        importer = RosterImporter(chunk_size=options['chunk_size'], workers=options['workers'])
+        try:
+            if options['path'] == '-':
+                stats = importer.run(read_roster(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig'), format))
+            else:
+                with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                    stats = importer.run(read_roster(stream, format))
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f'Не удалось прочитать ростер: {e}')
+
+        for number, text in importer.errors:
+            self.stderr.write(f'запись {number}: {text}' if number else text)
+        self.stdout.write(
+            f'Создано участников: {stats["created"]}, пропущено: {stats["skipped"]}, '
+            f'новых команд: {stats["teams_created"]}, вступили в команды: {stats["joined"]}'
+        )
@@ -0,0 +1,178 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from teams.models import Team
+from .models import User
+
+# Навык, который в команде уже есть, весит меньше недостающего
+COVERED_SKILL_WEIGHT = 0.2
+
+
+class MatchingSnapshot:
+    """Матрицы навыков свободных участников и открытых команд.
+
+    Счёт пары (участник, команда) - сумма весов навыков участника, где вес
+    навыка - его редкость (IDF), а уже закрытые командой навыки идут с
+    коэффициентом COVERED_SKILL_WEIGHT. Вектор участника делится на корень
+    из числа навыков, чтобы длинный список не перевешивал. Вся матрица
+    счетов считается одним умножением матриц при первом обращении.
+    """
+
+    def __init__(self, user_ids, team_ids, user_skills, team_skills, idf):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.team_ids = np.asarray(team_ids, dtype=np.int64)
+        self._user_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+        self._team_rows = {team_id: row for row, team_id in enumerate(team_ids)}
+        self._user_skills = np.asarray(user_skills, dtype=np.float32)
+        self._team_skills = np.asarray(team_skills, dtype=np.float32)
+        self._idf = np.asarray(idf, dtype=np.float32)
+        self._scores = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls):
+        free_users = User.objects.filter(team__isnull=True, is_active=True, role='participant')
+        open_teams = Team.objects.filter(is_active=True).open()
+        user_ids = list(free_users.order_by('id').values_list('id', flat=True))
+        team_ids = list(open_teams.order_by('id').values_list('id', flat=True))
+
+        through = User.skill_tags.through.objects
+        skill_users = dict(through.values_list('skill_id').annotate(users=Count('user_id')).order_by())
+        columns = {skill_id: column for column, skill_id in enumerate(skill_users)}
+        users_with_skills = through.values('user_id').distinct().count()
+        idf = np.ones(len(columns), dtype=np.float32)
+        for skill_id, users in skill_users.items():
+            idf[columns[skill_id]] += np.log((1 + users_with_skills) / (1 + users))
+
+        # Между запросами состав мог измениться: строки вне снимка пропускаем
+        user_skills = cls._matrix(user_ids, columns, through.filter(
+            user__in=free_users.values('id')
+        ).values_list('user_id', 'skill_id'))
+        team_skills = cls._matrix(team_ids, columns, through.filter(
+            user__team__in=open_teams.values('id')
+        ).values_list('user__team_id', 'skill_id').distinct())
+        return cls(user_ids, team_ids, user_skills, team_skills, idf)
+
+    @staticmethod
+    def _matrix(ids, columns, pairs):
+        rows = {object_id: row for row, object_id in enumerate(ids)}
+        matrix = np.zeros((len(ids), len(columns)), dtype=np.float32)
+        cells = [
+            (rows[object_id], columns[skill_id])
+            for object_id, skill_id in pairs.iterator()
+            if object_id in rows and skill_id in columns
+        ]
+        if cells:
+            matrix[tuple(np.array(cells).T)] = 1
+        return matrix
+
+    @property
+    def scores(self):
+        """Матрица счетов: строки - участники, столбцы - команды"""
+        with self._lock:
+            if self._scores is None:
+                weighted = self._user_skills * self._idf
+                skill_counts = self._user_skills.sum(axis=1, keepdims=True)
+                weighted /= np.sqrt(np.maximum(skill_counts, 1))
+                needs = 1 - (1 - COVERED_SKILL_WEIGHT) * self._team_skills
+                self._scores = weighted @ needs.T
+            return self._scores
+
+    @staticmethod
+    def _top(scores, ids, limit):
+        """limit лучших [(id, счёт)] по вектору счетов, без нулевых"""
+        if len(scores) > limit:
+            candidates = np.argpartition(-scores, limit)[:limit]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in candidates if scores[i] > 0]
+
+    def members_for_team(self, team_id, limit):
+        row = self._team_rows.get(team_id)
+        if row is None or not len(self.user_ids):
+            return []
+        return self._top(self.scores[:, row], self.user_ids, limit)
+
+    def teams_for_user(self, user_id, limit):
+        row = self._user_rows.get(user_id)
+        if row is None or not len(self.team_ids):
+            return []
+        return self._top(self.scores[row], self.team_ids, limit)
+
+    def teams_for_all_users(self, limit):
+        """{id участника: [(id команды, счёт)]} для всех свободных участников сразу"""
+        scores = self.scores
+        if not scores.size:
+            return {int(user_id): [] for user_id in self.user_ids}
+        limit = min(limit, scores.shape[1])
+        if limit < scores.shape[1]:
+            best = np.argpartition(-scores, limit, axis=1)[:, :limit]
+        else:
+            best = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        team_ids = self.team_ids[best]
+        return {
+            int(user_id): [
+                (int(team_id), float(score)) for team_id, score in zip(team_ids[row], best_scores[row]) if score > 0
+            ]
+            for row, user_id in enumerate(self.user_ids)
+        }
+
+
+class SkillMatcher:
+    """Подбор участников в команду и команд участнику по навыкам.
+
+    Снимок матриц строится при первом запросе и живёт max_age секунд.
+    Сигналы сбрасывают его при изменении навыков, состава и команд в этом
+    процессе; другие процессы увидят изменения не позже чем через max_age.
+    """
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+        self._generation = 0
+        self.builds = 0
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._built_at < self.max_age:
+                return self._snapshot
+            generation = self._generation
+        snapshot = MatchingSnapshot.build()
+        with self._lock:
+            self.builds += 1
+            # Сброс во время построения: снимок уже может быть устаревшим, не запоминаем
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._built_at = time.monotonic()
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def members_for_team(self, team_id, limit=None):
+        """Свободные участники для команды, лучшие первыми, с навыками"""
+        ranked = self.snapshot().members_for_team(team_id, limit or settings.MATCHING_RECOMMENDATIONS)
+        users = User.objects.prefetch_related('skill_tags').in_bulk([user_id for user_id, score in ranked])
+        return [users[user_id] for user_id, score in ranked if user_id in users]
+
+    def teams_for_user(self, user_id, limit=None):
+        """Открытые команды для участника без команды, лучшие первыми"""
+        ranked = self.snapshot().teams_for_user(user_id, limit or settings.MATCHING_RECOMMENDATIONS)
+        teams = Team.objects.select_related('leader').in_bulk([team_id for team_id, score in ranked])
+        return [teams[team_id] for team_id, score in ranked if team_id in teams]
+
+
+skill_matcher = SkillMatcher(max_age=settings.MATCHING_MAX_AGE)
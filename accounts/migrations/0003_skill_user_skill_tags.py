@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+def fill_skill_tags(apps, schema_editor):
+    Skill = apps.get_model('accounts', 'Skill')
+    User = apps.get_model('accounts', 'User')
+    skills = {}
+    for user in User.objects.exclude(skills='').only('id', 'skills'):
+        keys = set()
+        for part in user.skills.split(','):
+            name = ' '.join(part.split())[:50]
+            if name:
+                if name.casefold() not in skills:
+                    skills[name.casefold()] = Skill.objects.create(key=name.casefold(), name=name)
+                keys.add(name.casefold())
+        user.skill_tags.set([skills[key] for key in keys])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Skill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(max_length=50)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='skill_tags',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='users', to='accounts.skill'),
+        ),
+        migrations.RunPython(fill_skill_tags, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,28 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+SKILL_MAX_LENGTH = 50
+
+
+def parse_skills(text):
+    """Навыки из текста через запятую: {ключ: название}, ключ без учёта регистра"""
+    skills = {}
+    for part in (text or '').split(','):
+        name = ' '.join(part.split())[:SKILL_MAX_LENGTH]
+        if name:
+            skills.setdefault(name.casefold(), name)
+    return skills
+
+class Skill(models.Model):
+    key = models.CharField(max_length=SKILL_MAX_LENGTH, unique=True)
+    name = models.CharField(max_length=SKILL_MAX_LENGTH)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('participant', 'Участник'),
@@ -12,9 +34,22 @@ class User(AbstractUser):
     about = models.TextField(blank=True, help_text="О себе")
     team = models.ForeignKey('teams.Team', on_delete=models.SET_NULL, null=True, blank=True, related_name='members')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Нормализованные навыки из skills: по ним работает подбор команд,
+    # обновляются сигналом при сохранении skills
+    skill_tags = models.ManyToManyField(Skill, blank=True, related_name='users', editable=False)
     
     def __str__(self):
         return self.username
+    
+    def sync_skill_tags(self):
+        parsed = parse_skills(self.skills)
+        if set(parsed) == set(self.skill_tags.values_list('key', flat=True)):
+            return False
+        Skill.objects.bulk_create(
+            [Skill(key=key, name=name) for key, name in parsed.items()], ignore_conflicts=True
+        )
+        self.skill_tags.set(Skill.objects.filter(key__in=parsed))
+        return True
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -0,0 +1,233 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from hackathon_site.pools import SharedPool, spawn_pool
+from news.stats import site_stats
+from teams.models import Team
+from teams.snapshot import team_snapshots
+from .matching import skill_matcher
+from .models import Profile, Skill, User, parse_skills
+
+FORMATS = ('csv', 'ndjson')
+# Колонки ростера: импорт читает их (password - только импорт), экспорт пишет
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'role', 'skills', 'about')
+PROFILE_FIELDS = ('phone', 'github_link', 'telegram_link')
+TEAM_FIELDS = ('team', 'is_leader')
+EXPORT_FIELDS = USER_FIELDS + PROFILE_FIELDS + TEAM_FIELDS
+ROLES = {role for role, label in User.ROLE_CHOICES}
+EXPORT_BATCH_LINES = 500  # строк ростера в одном куске ответа под ASGI
+
+# Хеширование паролей для импорта из админки: процессы живут вместе с веб-процессом
+hashing_pool = SharedPool(workers=settings.ROSTER_HASH_WORKERS)
+
+
+def detect_format(filename, default='csv'):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    return 'csv' if extension == 'csv' else default
+
+
+def read_roster(stream, format):
+    """Строки ростера из текстового потока по одной, без чтения файла целиком"""
+    if format == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+
+def _is_true(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'да')
+
+
+class RosterImporter:
+    """Импорт участников пачками по chunk_size строк.
+
+    На пачку: один bulk_create пользователей, профилей, навыков и новых
+    команд, один bulk_update членства. Пароли хешируются в пуле процессов
+    (хеш - основная стоимость регистрации): workers - свой пул на время
+    импорта (команда), иначе общий пул процесса hashing_pool, чтобы
+    импорт из админки не запускал процессы на каждый запрос. Пустой
+    пароль - вход только после сброса. Пачка пишется в своей транзакции; уже существующие
+    имена пользователей пропускаются, так что повторный запуск безопасен.
+    Команда создаётся по первой строке с ней, лидер - строка с is_leader
+    или первый участник; участники сверх max_members не вступают.
+    """
+
+    def __init__(self, chunk_size=500, workers=None):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.stats = {'created': 0, 'skipped': 0, 'teams_created': 0, 'joined': 0}
+        self.errors = []
+
+    def run(self, rows):
+        if self.workers:
+            with spawn_pool(self.workers) as pool:
+                return self.run_with(rows, pool)
+        return self.run_with(rows, hashing_pool)
+
+    def run_with(self, rows, pool):
+        rows = iter(rows)
+        number = 1
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(list(enumerate(chunk, start=number)), pool)
+            number += len(chunk)
+        return self.stats
+
+    def error(self, number, text):
+        self.errors.append((number, text))
+        self.stats['skipped'] += 1
+
+    def clean(self, numbered_rows):
+        seen, cleaned = set(), []
+        for number, row in numbered_rows:
+            row = {key: str(value).strip() if value is not None else '' for key, value in row.items()}
+            username = row.get('username', '')
+            if not username:
+                self.error(number, 'нет username')
+            elif username in seen:
+                self.error(number, f'{username}: повтор в файле')
+            elif row.get('role') and row['role'] not in ROLES:
+                self.error(number, f'{username}: неизвестная роль {row["role"]}')
+            else:
+                seen.add(username)
+                cleaned.append((number, row))
+        existing = set(User.objects.filter(username__in=seen).values_list('username', flat=True))
+        for number, row in cleaned:
+            if row['username'] in existing:
+                self.error(number, f'{row["username"]}: уже зарегистрирован')
+        return [row for number, row in cleaned if row['username'] not in existing]
+
+    def import_chunk(self, numbered_rows, pool):
+        rows = self.clean(numbered_rows)
+        if not rows:
+            return
+        passwords = [row.get('password', '') for row in rows]
+        indexes = [i for i, password in enumerate(passwords) if password]
+        hashes = dict(zip(indexes, pool.map(make_password, [passwords[i] for i in indexes], chunksize=16)))
+
+        with transaction.atomic():
+            users = [
+                User(
+                    password=hashes.get(i) or make_password(None),
+                    role=row.get('role') or 'participant',
+                    **{field: row.get(field, '') for field in USER_FIELDS if field != 'role'},
+                )
+                for i, row in enumerate(rows)
+            ]
+            User.objects.bulk_create(users, batch_size=self.chunk_size)
+            # Не все базы возвращают id из bulk_create
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+            for user in users:
+                user.id = ids[user.username]
+
+            Profile.objects.bulk_create([
+                Profile(user=user, **{field: row.get(field, '') for field in PROFILE_FIELDS})
+                for user, row in zip(users, rows)
+            ], batch_size=self.chunk_size)
+            self.create_skill_tags(users)
+            touched_teams = self.assign_teams(users, rows)
+        self.stats['created'] += len(users)
+        team_snapshots.invalidate_on_commit(*touched_teams)
+        skill_matcher.invalidate()
+        # bulk_create мимо сигналов: счётчики главной страницы сбрасываем сами
+        site_stats.invalidate()
+
+    def create_skill_tags(self, users):
+        parsed = {user.id: parse_skills(user.skills) for user in users}
+        names = {key: name for skills in parsed.values() for key, name in skills.items()}
+        Skill.objects.bulk_create([Skill(key=key, name=name) for key, name in names.items()], ignore_conflicts=True)
+        skill_ids = dict(Skill.objects.filter(key__in=names).values_list('key', 'id'))
+        Through = User.skill_tags.through
+        Through.objects.bulk_create([
+            Through(user_id=user_id, skill_id=skill_ids[key])
+            for user_id, skills in parsed.items() for key in skills
+        ], batch_size=self.chunk_size)
+
+    def assign_teams(self, users, rows):
+        wanted = {}
+        for user, row in zip(users, rows):
+            if row.get('team'):
+                wanted.setdefault(row['team'], []).append((user, _is_true(row.get('is_leader'))))
+        if not wanted:
+            return []
+
+        teams = {team.name: team for team in Team.objects.select_for_update().filter(name__in=wanted)}
+        new_teams = []
+        for name, members in wanted.items():
+            if name not in teams:
+                leader = next((user for user, is_leader in members if is_leader), members[0][0])
+                new_teams.append(Team(name=name, leader=leader))
+        Team.objects.bulk_create(new_teams)
+        if new_teams:
+            self.stats['teams_created'] += len(new_teams)
+            teams.update((team.name, team) for team in Team.objects.filter(name__in=[t.name for t in new_teams]))
+
+        joined = []
+        for name, members in wanted.items():
+            team = teams[name]
+            free = max(team.max_members - team.member_count, 0)
+            # Лидер новой команды вступает первым
+            members.sort(key=lambda member: member[0].id != team.leader_id)
+            for user, is_leader in members[:free]:
+                user.team_id = team.id
+                joined.append(user)
+            team.member_count += min(free, len(members))
+            for user, is_leader in members[free:]:
+                self.errors.append((None, f'{user.username}: команда {name} заполнена'))
+        User.objects.bulk_update(joined, ['team'], batch_size=self.chunk_size)
+        Team.objects.bulk_update(teams.values(), ['member_count'], batch_size=self.chunk_size)
+        self.stats['joined'] += len(joined)
+        return [team.id for team in teams.values()]
+
+
+class _Echo:
+    """Файл для csv.writer, который просто возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def iter_roster(format, chunk_size=2000):
+    """Экспорт ростера строками CSV или NDJSON, по chunk_size пользователей за запрос"""
+    users = User.objects.filter(is_active=True).select_related('team', 'profile').order_by('id')
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+    for user in users.iterator(chunk_size=chunk_size):
+        profile = getattr(user, 'profile', None)
+        row = {field: getattr(user, field) for field in USER_FIELDS}
+        row.update({field: getattr(profile, field, '') for field in PROFILE_FIELDS})
+        row['team'] = user.team.name if user.team_id else ''
+        row['is_leader'] = bool(user.team_id) and user.team.leader_id == user.id
+        if format == 'csv':
+            row['is_leader'] = '1' if row['is_leader'] else ''
+            yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+        else:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+async def aiter_roster(format):
+    """iter_roster для ASGI: синхронный итератор обработчик Django прочитал
+    бы в память целиком. Куски по EXPORT_BATCH_LINES строк читаются в потоке
+    запроса - там же, где открыт курсор iterator().
+    """
+    lines = iter_roster(format)
+    next_batch = sync_to_async(lambda: list(islice(lines, EXPORT_BATCH_LINES)))
+    try:
+        while batch := await next_batch():
+            yield ''.join(batch)
+    finally:
+        await sync_to_async(lines.close)()
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from hackathon_site.images import image_variants
+from teams.models import Team
+from .matching import skill_matcher
+from .models import Profile, User
+
+# Поля, от которых зависит подбор: навыки и то, свободен ли участник
+MATCHING_FIELDS = {'skills', 'team', 'is_active', 'role'}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not MATCHING_FIELDS & set(update_fields):
+        return
+    if update_fields is None or 'skills' in update_fields:
+        instance.sync_skill_tags()
+    skill_matcher.invalidate()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def matching_changed(sender, **kwargs):
+    skill_matcher.invalidate()
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, **kwargs):
+    image_variants.schedule_on_commit(instance.avatar)
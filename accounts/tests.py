@@ -1,3 +1,216 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from hackathon_site.testing import asgi_get
+from teams.models import Team
+from . import roster
+from .matching import MatchingSnapshot, skill_matcher
+from .models import Profile, Skill, User
+
+
+class SkillTagsTests(TestCase):
+    def test_skills_text_is_normalized_into_tags(self):
+        user = User.objects.create_user('user', password='pass', skills='Python,  django , python,,Machine  Learning')
+        self.assertEqual(
+            sorted(user.skill_tags.values_list('key', 'name')),
+            [('django', 'django'), ('machine learning', 'Machine Learning'), ('python', 'Python')]
+        )
+
+        other = User.objects.create_user('other', password='pass', skills='PYTHON')
+        self.assertEqual(Skill.objects.count(), 3)
+        other.skills = 'Figma'
+        other.save()
+        self.assertEqual(list(other.skill_tags.values_list('name', flat=True)), ['Figma'])
+
+    def test_unrelated_save_does_not_touch_tags(self):
+        user = User.objects.create_user('user', password='pass', skills='Python')
+        user.skills = 'Go'
+        user.save(update_fields=['last_login'])
+        self.assertEqual(list(user.skill_tags.values_list('name', flat=True)), ['Python'])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SkillMatcherTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', password='pass', skills='Python, Django')
+        cls.team = Team.objects.create(name='Alpha', leader=cls.leader, member_count=1)
+        cls.leader.team = cls.team
+        cls.leader.save()
+        cls.designer = User.objects.create_user('designer', password='pass', skills='Figma')
+        cls.backend = User.objects.create_user('backend', password='pass', skills='Python')
+        cls.newbie = User.objects.create_user('newbie', password='pass')
+
+    def setUp(self):
+        skill_matcher.invalidate()
+
+    def test_missing_skills_rank_first(self):
+        self.assertEqual(skill_matcher.members_for_team(self.team.id), [self.designer, self.backend])
+        self.assertEqual(skill_matcher.teams_for_user(self.designer.id), [self.team])
+        self.assertEqual(skill_matcher.teams_for_user(self.newbie.id), [])
+        self.assertEqual(skill_matcher.teams_for_user(self.leader.id), [])
+
+    def test_snapshot_is_reused_until_profile_or_team_changes(self):
+        skill_matcher.members_for_team(self.team.id)
+        builds = skill_matcher.builds
+        skill_matcher.members_for_team(self.team.id)
+        self.assertEqual(skill_matcher.builds, builds)
+
+        self.newbie.skills = 'Rust, Figma'
+        self.newbie.save()
+        self.assertEqual(skill_matcher.members_for_team(self.team.id)[0], self.newbie)
+        self.assertEqual(skill_matcher.builds, builds + 1)
+
+        Team.objects.filter(id=self.team.id).update(max_members=1)
+        self.team.refresh_from_db()
+        self.team.save()
+        self.assertEqual(skill_matcher.members_for_team(self.team.id), [])
+
+    def test_pages_show_recommendations(self):
+        self.client.force_login(self.leader)
+        response = self.client.get(reverse('teams:detail', args=[self.team.id]))
+        self.assertEqual(response.context['recommended_members'], [self.designer, self.backend])
+
+        self.client.force_login(self.designer)
+        response = self.client.get(reverse('accounts:profile'))
+        self.assertEqual(response.context['recommended_teams'], [self.team])
+        self.assertContains(response, 'Figma')
+
+    def test_batch_recommendation_is_fast(self):
+        rng = np.random.default_rng(0)
+        users, teams, skills = 5000, 500, 300
+        snapshot = MatchingSnapshot(
+            list(range(users)), list(range(teams)),
+            rng.random((users, skills)) < 0.02, rng.random((teams, skills)) < 0.05,
+            1 + rng.random(skills),
+        )
+
+        started = time.perf_counter()
+        recommendations = snapshot.teams_for_all_users(limit=5)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(recommendations), users)
+        self.assertEqual(recommendations[7], snapshot.teams_for_user(7, limit=5))
+        # Одно умножение матриц: десятки миллисекунд на тысячи участников
+        self.assertLess(elapsed, 0.5)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class RosterTests(TestCase):
+    ROWS = [
+        {'username': 'anna', 'password': 's3cret-pass', 'email': 'anna@example.com', 'skills': 'Python, SQL',
+         'team': 'Alpha', 'phone': '+7 900'},
+        {'username': 'boris', 'password': 'other-pass', 'first_name': 'Борис', 'team': 'Alpha', 'is_leader': '1'},
+        {'username': 'anna', 'password': 'again'},
+        {'username': 'taken'},
+        {'username': 'vera', 'role': 'admin', 'skills': 'python'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('taken', password='pass')
+
+    def write_roster(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(content)
+        return path
+
+    def assert_imported(self):
+        anna, boris, vera = (User.objects.get(username=name) for name in ('anna', 'boris', 'vera'))
+        self.assertTrue(anna.check_password('s3cret-pass'))
+        self.assertFalse(vera.has_usable_password())
+        self.assertEqual(vera.role, 'admin')
+        self.assertEqual(Profile.objects.get(user=anna).phone, '+7 900')
+        self.assertEqual(sorted(anna.skill_tags.values_list('key', flat=True)), ['python', 'sql'])
+        self.assertEqual(Skill.objects.count(), 2)
+        team = Team.objects.get(name='Alpha')
+        self.assertEqual(team.leader, boris)
+        self.assertEqual(team.member_count, 2)
+        self.assertEqual(set(team.members.all()), {anna, boris})
+
+    def test_import_ndjson_in_chunks(self):
+        path = self.write_roster('roster.ndjson', ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in self.ROWS))
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_roster', path, chunk_size=2, workers=2, stdout=out, stderr=err)
+
+        self.assert_imported()
+        self.assertIn('Создано участников: 3, пропущено: 2, новых команд: 1, вступили в команды: 2', out.getvalue())
+        self.assertIn('запись 3: anna: уже зарегистрирован', err.getvalue())
+
+    def test_export_round_trips_through_import(self):
+        path = self.write_roster('roster.ndjson', ''.join(json.dumps(row) + '\n' for row in self.ROWS))
+        call_command('import_roster', path, workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        out = io.StringIO()
+        call_command('export_roster', format='csv', stdout=out)
+        rows = {row['username']: row for row in csv.DictReader(io.StringIO(out.getvalue()))}
+        self.assertEqual(set(rows), {'taken', 'anna', 'boris', 'vera'})
+        self.assertEqual((rows['boris']['team'], rows['boris']['is_leader']), ('Alpha', '1'))
+        self.assertEqual((rows['anna']['skills'], rows['anna']['phone']), ('Python, SQL', '+7 900'))
+
+        User.objects.exclude(username='taken').delete()
+        Team.objects.all().delete()
+        call_command('import_roster', self.write_roster('export.csv', out.getvalue()), workers=1,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Team.objects.get(name='Alpha').leader.username, 'boris')
+        self.assertEqual(Profile.objects.get(user__username='anna').phone, '+7 900')
+
+    def test_admin_upload_and_streaming_export(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+        content = 'username,password,team,is_leader\nanna,s3cret-pass,Alpha,1\n'
+        response = self.client.post(reverse('admin:accounts_user_import_roster'), {
+            'roster': SimpleUploadedFile('roster.csv', content.encode()),
+        }, follow=True)
+        self.assertContains(response, 'Создано участников: 1')
+        self.assertEqual(Team.objects.get(name='Alpha').leader.username, 'anna')
+
+        response = self.client.get(reverse('admin:accounts_user_export_roster'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertIn({'username': 'anna', 'team': 'Alpha', 'is_leader': True},
+                      [{key: row[key] for key in ('username', 'team', 'is_leader')} for row in rows])
+
+    def test_admin_roster_requires_permissions(self):
+        staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('admin:accounts_user_export_roster')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:accounts_user_import_roster')).status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_user'))
+        self.assertEqual(self.client.get(reverse('admin:accounts_user_export_roster')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('admin:accounts_user_import_roster')).status_code, 403)
+
+
+class RosterAsgiExportTests(TransactionTestCase):
+    """Выгрузка через ASGIHandler: ростер уходит кусками, а не списком в памяти"""
+
+    def test_export_streams_in_batches(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+        for i in range(5):
+            User.objects.create_user(f'user{i}', password='pass')
+
+        with mock.patch.object(roster, 'EXPORT_BATCH_LINES', 2):
+            status, headers, chunks, buffered = async_to_sync(asgi_get)(
+                reverse('admin:accounts_user_export_roster'), self.client.cookies, query_string=b'format=ndjson'
+            )
+        self.assertEqual((status, buffered), (200, False))
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual({row['username'] for row in rows}, {'admin'} | {f'user{i}' for i in range(5)})
@@ -4,6 +4,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
+from .matching import skill_matcher
 from .models import User, Profile
 from .forms import CustomUserCreationForm, ProfileForm
 
@@ -26,6 +27,13 @@ class ProfileView(LoginRequiredMixin, DetailView):
     
     def get_object(self):
         return get_object_or_404(User, username=self.request.user.username)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['skills'] = self.object.skill_tags.all()
+        if not self.object.team_id:
+            context['recommended_teams'] = skill_matcher.teams_for_user(self.object.id)
+        return context
 
 class ProfileEditView(LoginRequiredMixin, UpdateView):
     model = Profile
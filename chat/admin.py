@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import ChatRoom, Message, MessageAttachment
+from django.db.models import Q
+from .models import ChatRoom, Message, MessageAttachment, message_search
 
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
@@ -15,12 +16,23 @@ class MessageAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     date_hierarchy = 'created_at'
     
+    def get_search_results(self, request, queryset, search_term):
+        # icontains по content - полный просмотр таблицы, ищем по полнотекстовому индексу
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            message_search.match_q(queryset, search_term) |
+            Q(author__username__iexact=search_term) |
+            Q(chat_room__team__name__iexact=search_term)
+        ), False
+    
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Сообщение'
 
 @admin.register(MessageAttachment)
 class MessageAttachmentAdmin(admin.ModelAdmin):
-    list_display = ('message', 'filename', 'uploaded_at')
-    search_fields = ('filename', 'message__content')
-    readonly_fields = ('uploaded_at',)
+    list_display = ('message', 'filename', 'size', 'content_type', 'uploaded_at')
+    search_fields = ('filename', 'message__content', 'sha256')
+    readonly_fields = ('uploaded_at', 'sha256', 'size')
@@ -0,0 +1,207 @@
+import bisect
+import mmap
+import os
+import struct
+import zlib
+
+from django.conf import settings
+
+# Запись индекса: первый id, последний id, номер сегмента, смещение и длина блока
+RECORD = struct.Struct('<QQIQI')
+
+# Размер индекса -> последний id; чтобы не читать файл на каждый запрос истории
+_last_ids = {}
+
+
+class _Index:
+    """Индекс архива, отображённый в память: последовательность записей RECORD"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.count = size // RECORD.size
+
+    def __getitem__(self, position):
+        return RECORD.unpack_from(self._map, position * RECORD.size)
+
+    def __len__(self):
+        return self.count
+
+    def find(self, before_id):
+        """Позиция последнего блока, где есть id меньше before_id"""
+        first_ids = _Column(self, 0)
+        return bisect.bisect_left(first_ids, before_id) - 1
+
+    def close(self):
+        if self.count:
+            self._map.close()
+        self._file.close()
+
+
+class _Column:
+    """Столбец индекса для bisect без чтения всего файла"""
+
+    def __init__(self, index, column):
+        self.index = index
+        self.column = column
+
+    def __getitem__(self, position):
+        return self.index[position][self.column]
+
+    def __len__(self):
+        return len(self.index)
+
+
+class RoomArchive:
+    """Холодный архив истории одной комнаты.
+
+    Сообщения лежат в сегментах только для дозаписи блоками по
+    CHAT_ARCHIVE_BLOCK_MESSAGES, каждый блок сжат zlib и содержит строки
+    "id\\tauthor_id\\tjson". Файл index хранит по записи на блок, блоки
+    идут по возрастанию id. Чтение идёт через mmap и распаковывает только
+    нужные блоки, поэтому память не зависит от размера архива.
+    """
+
+    def __init__(self, kind, room_id):
+        self.path = os.path.join(str(settings.CHAT_ARCHIVE_ROOT), kind, str(room_id))
+        self.index_path = os.path.join(self.path, 'index')
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f'{segment:06d}.seg')
+
+    @property
+    def last_id(self):
+        """Последний id в архиве, 0 - архива нет"""
+        try:
+            size = os.stat(self.index_path).st_size
+        except FileNotFoundError:
+            return 0
+        if size < RECORD.size:
+            return 0
+        cached = _last_ids.get(self.index_path)
+        if cached is None or cached[0] != size:
+            with open(self.index_path, 'rb') as index:
+                index.seek(size - size % RECORD.size - RECORD.size)
+                cached = _last_ids[self.index_path] = (size, RECORD.unpack(index.read(RECORD.size))[1])
+        return cached[1]
+
+    # Запись
+
+    def append(self, rows):
+        """Дописывает (id, author_id, fragment) по возрастанию id, все новее last_id"""
+        if not rows:
+            return
+        if rows[0][0] <= self.last_id:
+            raise ValueError('Archive is append-only: ids must be greater than last_id')
+        os.makedirs(self.path, exist_ok=True)
+
+        block_size = settings.CHAT_ARCHIVE_BLOCK_MESSAGES
+        with open(self.index_path, 'ab') as index:
+            # Недописанная при сбое запись индекса отбрасывается
+            if index.tell() % RECORD.size:
+                index.truncate(index.tell() - index.tell() % RECORD.size)
+            segment = index.tell() and self._last_segment()
+            for start in range(0, len(rows), block_size):
+                block = rows[start:start + block_size]
+                data = zlib.compress(b''.join(
+                    b'%d\t%d\t%s\n' % (message_id, author_id, fragment)
+                    for message_id, author_id, fragment in block
+                ))
+                segment_path = self._segment_path(segment)
+                if os.path.exists(segment_path) and (
+                    os.path.getsize(segment_path) >= settings.CHAT_ARCHIVE_SEGMENT_SIZE
+                ):
+                    segment += 1
+                    segment_path = self._segment_path(segment)
+                with open(segment_path, 'ab') as segment_file:
+                    offset = segment_file.tell()
+                    segment_file.write(data)
+                    segment_file.flush()
+                    os.fsync(segment_file.fileno())
+                # Запись в индекс - только после того, как блок на диске
+                index.write(RECORD.pack(block[0][0], block[-1][0], segment, offset, len(data)))
+                index.flush()
+                os.fsync(index.fileno())
+
+    def _last_segment(self):
+        index = _Index(self.index_path)
+        try:
+            return index[len(index) - 1][2]
+        finally:
+            index.close()
+
+    # Чтение
+
+    def _read_block(self, record, segments):
+        first_id, last_id, segment, offset, length = record
+        if segment not in segments:
+            file = open(self._segment_path(segment), 'rb')
+            segments[segment] = (file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        data = zlib.decompress(segments[segment][1][offset:offset + length])
+        rows = []
+        for line in data.splitlines():
+            message_id, author_id, fragment = line.split(b'\t', 2)
+            rows.append((int(message_id), int(author_id), fragment))
+        return rows
+
+    def _scan(self, visit):
+        if not self.last_id:
+            return
+        index = _Index(self.index_path)
+        segments = {}
+        try:
+            visit(index, lambda record: self._read_block(record, segments))
+        finally:
+            for file, mapped in segments.values():
+                mapped.close()
+                file.close()
+            index.close()
+
+    def page(self, before_id=None, limit=50):
+        """Самые новые limit сообщений старше before_id, по возрастанию id"""
+        result = []
+
+        def visit(index, read_block):
+            position = len(index) - 1 if before_id is None else index.find(before_id)
+            while position >= 0 and len(result) < limit:
+                rows = [row for row in read_block(index[position])
+                        if before_id is None or row[0] < before_id]
+                result[:0] = rows[-(limit - len(result)):]
+                position -= 1
+
+        self._scan(visit)
+        return result
+
+    def archived_ids(self, first_id, last_id):
+        """id из архива в диапазоне [first_id, last_id]"""
+        found = set()
+
+        def visit(index, read_block):
+            position = max(index.find(first_id + 1), 0)
+            while position < len(index) and index[position][0] <= last_id:
+                found.update(row[0] for row in read_block(index[position])
+                             if first_id <= row[0] <= last_id)
+                position += 1
+
+        self._scan(visit)
+        return found
+
+    def merge_page(self, rows, has_more, before_id, limit, convert=None):
+        """Дополняет страницу истории из базы сообщениями из архива.
+
+        rows - (id, author_id, fragment) по возрастанию id, has_more - есть ли
+        в базе ещё более старые, convert(author_id, fragment) - как превратить
+        фрагмент из архива в ответ API. Возвращает объединённую страницу и has_more.
+        """
+        last_id = self.last_id
+        if not last_id or (has_more and rows and rows[0][0] > last_id):
+            return rows, has_more
+        archived = self.page(before_id, limit + 1)
+        if convert is not None:
+            archived = [(message_id, author_id, convert(author_id, fragment))
+                        for message_id, author_id, fragment in archived]
+        merged = {row[0]: row for row in archived}
+        merged.update((row[0], row) for row in rows)
+        merged = [merged[message_id] for message_id in sorted(merged)]
+        return merged[-limit:], has_more or len(merged) > limit
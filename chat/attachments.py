@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - хэш содержимого.
+
+    Одинаковый файл, отправленный в несколько чатов, лежит на диске
+    один раз. Запись идёт во временный файл и атомарно переименовывается,
+    поэтому одновременная загрузка одного и того же файла безопасна.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # То же имя - то же содержимое, суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        temporary_name = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(temporary_name), self.path(name))
+        return name
+
+
+def file_sha256(file):
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks(CHUNK_SIZE):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def attachment_upload_to(instance, filename):
+    instance.sha256 = file_sha256(instance.file.file)
+    return f'chat_attachments/{instance.sha256[:2]}/{instance.sha256}'
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку кусками во временный файл и считает sha256 на лету"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.CHAT_ATTACHMENT_MAX_SIZE:
+            raise StopUpload(connection_reset=True)
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+def parse_range(header, size):
+    """Один диапазон из заголовка Range: (start, end) включительно.
+
+    None - заголовок не поддерживается (отдаём файл целиком),
+    False - диапазон за пределами файла (416).
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500: последние 500 байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_file_range(file, start, length):
+    """Читает файл кусками, не загружая его в память целиком"""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+async def aiter_file_range(file, start, length):
+    """iter_file_range для ASGI: синхронный итератор обработчик Django
+    прочитал бы в память целиком, здесь каждый кусок читается в потоке
+    """
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        await sync_to_async(file.seek, thread_sensitive=False)(start)
+        while length > 0:
+            chunk = await read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
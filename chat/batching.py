@@ -0,0 +1,100 @@
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ChatRoom, Message
+
+
+class _PendingMessage:
+    __slots__ = ('message', 'done', 'error')
+
+    def __init__(self, message):
+        self.message = message
+        self.done = threading.Event()
+        self.error = None
+
+
+class MessageBatchWriter:
+    """Групповая запись сообщений чата (group commit).
+
+    Первый поток, пришедший с сообщением, становится лидером: ждёт окно
+    window секунд (или пока не наберётся max_batch сообщений), забирает
+    всё накопленное и записывает одним bulk_create в одной транзакции.
+    Остальные потоки ждут результата и получают сохранённое сообщение
+    с id. Пока лидер пишет, следующий пришедший становится новым лидером.
+
+    Пачки собираются из запросов, которые процесс обслуживает параллельно:
+    под ASGI у каждого запроса свой поток для синхронных view, под WSGI -
+    потоки сервера. Ожидающий дольше follower_timeout получает TimeoutError;
+    если его сообщение ещё не забрал лидер, оно снимается с записи.
+    """
+
+    def __init__(self, window, max_batch, follower_timeout=10):
+        self.window = window
+        self.max_batch = max_batch
+        self.follower_timeout = follower_timeout
+        self._lock = threading.Lock()
+        self._pending = []
+        self._batch_full = threading.Event()
+        self._has_leader = False
+
+    def submit(self, message):
+        """Сохраняет сообщение в составе пачки и возвращает его после коммита"""
+        entry = _PendingMessage(message)
+        with self._lock:
+            self._pending.append(entry)
+            is_leader = not self._has_leader
+            self._has_leader = True
+            if len(self._pending) >= self.max_batch:
+                self._batch_full.set()
+
+        if is_leader:
+            self._batch_full.wait(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._has_leader = False
+                self._batch_full.clear()
+            self._write(batch)
+        elif not entry.done.wait(self.follower_timeout):
+            with self._lock:
+                if entry in self._pending:
+                    self._pending.remove(entry)
+            raise TimeoutError('Message batch was not written in time')
+
+        if entry.error is not None:
+            raise entry.error
+        return entry.message
+
+    def _write(self, batch):
+        messages = [entry.message for entry in batch]
+        try:
+            with transaction.atomic():
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Message.objects.bulk_create(messages)
+                else:
+                    # Без RETURNING id не узнать из bulk_create, но коммит всё равно один
+                    for message in messages:
+                        message.save()
+                # Счётчики комнаты - одним UPDATE на комнату за всю пачку
+                ChatRoom.record_messages(messages)
+        except Exception:
+            # Одно плохое сообщение не должно ронять всю пачку
+            for entry in batch:
+                try:
+                    entry.message.pk = None
+                    with transaction.atomic():
+                        entry.message.save()
+                        ChatRoom.record_messages([entry.message])
+                except Exception as e:
+                    entry.error = e
+        finally:
+            for entry in batch:
+                entry.done.set()
+
+
+batch_writer = MessageBatchWriter(
+    window=settings.CHAT_BATCH_WINDOW,
+    max_batch=settings.CHAT_BATCH_MAX_SIZE,
+    follower_timeout=settings.CHAT_BATCH_FOLLOWER_TIMEOUT,
+)
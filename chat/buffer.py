@@ -0,0 +1,235 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from .fragments import chat_message_fragment
+from .models import ChatRoom, Message, MessageChange
+
+# Примерный расход памяти на одно сообщение сверх JSON: объект bytes, int, ссылки
+MESSAGE_OVERHEAD = 100
+
+
+def _message_size(fragment):
+    return MESSAGE_OVERHEAD + len(fragment)
+
+
+class RoomBuffer:
+    """Последние сообщения одной комнаты (готовый JSON) по возрастанию id.
+
+    Все сообщения с id > floor_id лежат в буфере. floor_id == 0 значит,
+    что буфер содержит всю комнату. change_seq - номер ленты изменений
+    комнаты, прочитанный до загрузки сообщений.
+    """
+
+    __slots__ = ('ids', 'messages', 'floor_id', 'change_seq', 'size', 'checked_at')
+
+    def __init__(self, messages, floor_id, change_seq=0):
+        self.ids = [message_id for message_id, fragment in messages]
+        self.messages = [fragment for message_id, fragment in messages]
+        self.floor_id = floor_id
+        self.change_seq = change_seq
+        self.size = sum(_message_size(fragment) for fragment in self.messages)
+        self.checked_at = time.monotonic()
+
+    @property
+    def last_id(self):
+        return self.ids[-1] if self.ids else self.floor_id
+
+    def add(self, message_id, fragment, capacity):
+        if message_id <= self.floor_id:
+            return 0
+        position = bisect.bisect_left(self.ids, message_id)
+        if position < len(self.ids) and self.ids[position] == message_id:
+            return 0
+        self.ids.insert(position, message_id)
+        self.messages.insert(position, fragment)
+        added = _message_size(fragment)
+        self.size += added
+
+        freed = 0
+        while len(self.ids) > capacity:
+            self.floor_id = self.ids.pop(0)
+            freed += _message_size(self.messages.pop(0))
+        self.size -= freed
+        return added - freed
+
+    def page(self, after_id, limit):
+        """(сообщения, есть ли ещё) или None, если курсор старше буфера"""
+        if after_id is None:
+            if len(self.ids) < limit and self.floor_id:
+                return None
+            return self.messages[-limit:], len(self.ids) > limit or bool(self.floor_id)
+        if after_id < self.floor_id:
+            return None
+        start = bisect.bisect_right(self.ids, after_id)
+        return self.messages[start:start + limit], len(self.ids) - start > limit
+
+
+class RecentMessagesBuffer:
+    """Кольцевые буферы последних сообщений по комнатам с вытеснением LRU.
+
+    Опрос новых сообщений отвечает из памяти без запроса к базе. Буфер
+    заполняется записью SendMessageView, а сообщения из других процессов
+    догружаются одним индексным запросом не чаще раза в max_staleness секунд.
+    Тогда же по ленте изменений проверяется, не правили ли и не удаляли ли
+    сообщения в других процессах: если да, комната загружается заново.
+    """
+
+    def __init__(self, per_room, max_bytes, max_staleness):
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self.max_staleness = max_staleness
+        self._rooms = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._rooms) > 1:
+            room_id, room = self._rooms.popitem(last=False)
+            self._size -= room.size
+            self.evictions += 1
+
+    def _load(self, room_id):
+        # Номер читаем первым: правка после него сдвинет номер ещё раз
+        change_seq = ChatRoom.objects.filter(id=room_id).values_list('change_seq', flat=True).first() or 0
+        rows = list(
+            Message.objects.filter(chat_room_id=room_id)
+            .select_related('author').order_by('-id')[:self.per_room + 1]
+        )
+        floor_id = rows.pop().id if len(rows) > self.per_room else 0
+        return RoomBuffer(
+            [(msg.id, chat_message_fragment(msg)) for msg in reversed(rows)], floor_id, change_seq
+        )
+
+    def _get_room(self, room_id):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None:
+                self._rooms.move_to_end(room_id)
+                if time.monotonic() - room.checked_at <= self.max_staleness:
+                    return room
+
+        # Запросы к базе - вне блокировки
+        loaded = new_messages = None
+        if room is None:
+            loaded = self._load(room_id)
+        else:
+            change_seq, pruned_change_seq, changed = ChatRoom.objects.filter(id=room_id).annotate(
+                changed=Exists(
+                    MessageChange.objects.filter(chat_room_id=OuterRef('pk'), seq__gt=room.change_seq)
+                    .exclude(kind=MessageChange.INSERT)
+                )
+            ).values_list('change_seq', 'pruned_change_seq', 'changed').first() or (0, 0, False)
+            if changed or room.change_seq < pruned_change_seq:
+                # Правку или удаление из ленты уже не различить - читаем комнату заново
+                loaded = self._load(room_id)
+            else:
+                rows = list(
+                    Message.objects.filter(chat_room_id=room_id, id__gt=room.last_id)
+                    .select_related('author').order_by('id')[:self.per_room + 1]
+                )
+                if len(rows) > self.per_room:
+                    loaded = self._load(room_id)
+                else:
+                    new_messages = [(msg.id, chat_message_fragment(msg)) for msg in rows]
+
+        with self._lock:
+            if loaded is not None:
+                previous = self._rooms.pop(room_id, None)
+                if previous is not None:
+                    self._size -= previous.size
+                room = self._rooms[room_id] = loaded
+                self._size += room.size
+            else:
+                self.refreshes += 1
+                if room_id not in self._rooms:
+                    # Комнату успели вытеснить, пока шёл запрос
+                    self._rooms[room_id] = room
+                    self._size += room.size
+                for message_id, fragment in new_messages:
+                    self._size += room.add(message_id, fragment, self.per_room)
+                room.change_seq = max(room.change_seq, change_seq)
+                room.checked_at = time.monotonic()
+            self._evict()
+        return room
+
+    def get_page(self, room_id, after_id=None, limit=50):
+        """Страница новых сообщений или None, если нужен запрос к базе"""
+        room = self._get_room(room_id)
+        with self._lock:
+            page = room.page(after_id, limit)
+            if page is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            messages, has_more = page
+            return messages, has_more, room.last_id
+
+    def get_latest_id(self, room_id):
+        room = self._get_room(room_id)
+        return room.last_id
+
+    def get_version(self, room_id):
+        """(последний id, номер ленты изменений) - меняется и при правке сообщений"""
+        room = self._get_room(room_id)
+        with self._lock:
+            return room.last_id, room.change_seq
+
+    def add(self, room_id, message_id, fragment):
+        """Запись нового сообщения (write-through из SendMessageView)"""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                # Комната не загружена - при первом опросе прочитаем из базы
+                return
+            self._size += room.add(message_id, fragment, self.per_room)
+            self._rooms.move_to_end(room_id)
+            self._evict()
+
+    def expire(self, room_id):
+        """Следующее чтение комнаты догрузит новые сообщения из базы (запись в другом процессе)"""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None:
+                room.checked_at = 0.0
+
+    def forget(self, room_id):
+        """Сбрасывает комнату после правки или удаления сообщения"""
+        with self._lock:
+            room = self._rooms.pop(room_id, None)
+            if room is not None:
+                self._size -= room.size
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'rooms': len(self._rooms),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions,
+            }
+
+
+recent_messages = RecentMessagesBuffer(
+    per_room=settings.CHAT_BUFFER_MESSAGES_PER_ROOM,
+    max_bytes=settings.CHAT_BUFFER_MAX_BYTES,
+    max_staleness=settings.CHAT_BUFFER_MAX_STALENESS,
+)
@@ -0,0 +1,263 @@
+import errno
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Заголовок события: время отправки, комната, вид события, id сообщения или seq
+HEADER = struct.Struct('<dQBQ')
+
+# Как часто перечитывать каталог с сокетами процессов
+PEER_REFRESH_INTERVAL = 1.0  # seconds
+
+
+class BusStats:
+    """Задержка доставки событий в этот процесс и счётчики потерь"""
+
+    def __init__(self, window=1024):
+        self._latencies = deque(maxlen=window)
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def record(self, latency):
+        with self._lock:
+            self._counts['received'] += 1
+            self._latencies.append(latency)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 3)
+
+        return {
+            'sent': counts.get('sent', 0),
+            'received': counts.get('received', 0),
+            # Получатель не успевает разбирать очередь - событие не отправлено
+            'dropped_full': counts.get('dropped_full', 0),
+            # Событие пришло позже max_latency - клиенты догонят его сами
+            'dropped_stale': counts.get('dropped_stale', 0),
+            'latency_ms': {
+                'p50': percentile(0.50), 'p95': percentile(0.95),
+                'p99': percentile(0.99), 'max': percentile(1.0),
+            },
+        }
+
+
+class EventBus:
+    """Рассылка событий чата между процессами одного хоста.
+
+    publish() никогда не ждёт получателей: если очередь получателя полна,
+    событие отбрасывается и учитывается в stats. События старше max_latency
+    получатель тоже отбрасывает. Пропуски клиенты догоняют через ленту
+    изменений и long polling, поэтому шина только ускоряет доставку.
+    """
+
+    def __init__(self, max_latency=None, max_body=None):
+        self.max_latency = settings.CHAT_EVENT_BUS_MAX_LATENCY if max_latency is None else max_latency
+        self.max_body = settings.CHAT_EVENT_BUS_MAX_BODY if max_body is None else max_body
+        self.stats = BusStats()
+        self._handler = None
+        self._start_lock = threading.Lock()
+
+    def start(self, handler):
+        """Начинает приём событий других процессов: handler(room_id, kind, ref, body).
+
+        Повторный вызов ничего не делает. Процессы без подписчиков
+        (management-команды) только отправляют и приём не запускают.
+        """
+        with self._start_lock:
+            if self._handler is None:
+                self._handler = handler
+                self._listen()
+
+    def publish(self, room_id, kind, ref, body=b''):
+        """Отправляет событие остальным процессам, возвращает число получателей.
+
+        Тело длиннее max_body не передаётся - получатель загрузит его сам.
+        """
+        if len(body) > self.max_body:
+            body = b''
+        return self._send(HEADER.pack(time.time(), room_id, kind, ref) + body)
+
+    def _dispatch(self, data):
+        sent_at, room_id, kind, ref = HEADER.unpack_from(data)
+        latency = time.time() - sent_at
+        if latency > self.max_latency:
+            self.stats.count('dropped_stale')
+            return
+        self.stats.record(latency)
+        handler = self._handler
+        if handler is None:
+            return
+        try:
+            handler(room_id, kind, ref, data[HEADER.size:])
+        except Exception:
+            logger.exception('Chat event handler failed')
+
+    def _listen(self):
+        raise NotImplementedError
+
+    def _send(self, data):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class UnixSocketEventBus(EventBus):
+    """Шина на датаграммных Unix-сокетах без отдельного брокера.
+
+    Каждый процесс с подписчиками слушает свой сокет в каталоге
+    CHAT_EVENT_BUS_DIR, отправитель пишет датаграмму в каждый сокет каталога
+    без блокировки. Очередь сокета ограничена ядром: если получатель
+    не успевает, sendto возвращает EAGAIN и событие теряется только для него.
+    """
+
+    def __init__(self, directory=None, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = str(directory or settings.CHAT_EVENT_BUS_DIR)
+        self.path = None
+        self._receiver = None
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._peers = []
+        self._peers_checked_at = 0.0
+
+    def _listen(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        threading.Thread(target=self._receive_loop, args=(self._receiver,), daemon=True).start()
+
+    def _receive_loop(self, receiver):
+        size = HEADER.size + self.max_body
+        while True:
+            try:
+                data = receiver.recv(size)
+            except OSError:
+                return
+            if not data:
+                # Сокет закрыт в stop()
+                return
+            self._dispatch(data)
+
+    def _get_peers(self):
+        now = time.monotonic()
+        if now - self._peers_checked_at > PEER_REFRESH_INTERVAL:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            self._peers = [
+                os.path.join(self.directory, name) for name in names
+                if name.endswith('.sock') and os.path.join(self.directory, name) != self.path
+            ]
+            self._peers_checked_at = now
+        return self._peers
+
+    def _send(self, data):
+        delivered = 0
+        for path in self._get_peers():
+            try:
+                self._sender.sendto(data, path)
+                delivered += 1
+            except BlockingIOError:
+                self.stats.count('dropped_full')
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Процесс завершился, не убрав сокет
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._peers_checked_at = 0.0
+            except OSError as error:
+                if error.errno != errno.EMSGSIZE:
+                    raise
+                logger.warning('Chat event of %d bytes does not fit into a datagram', len(data))
+        self.stats.count('sent', delivered)
+        return delivered
+
+    def stop(self):
+        if self._receiver is not None:
+            try:
+                self._receiver.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._receiver.close()
+            self._receiver = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._handler = None
+
+
+class InMemoryEventBus(EventBus):
+    """Шина внутри одного процесса: для разработки с одним процессом и тестов.
+
+    Экземпляры с общим hub ведут себя как отдельные процессы: у каждого
+    своя ограниченная очередь и поток доставки.
+    """
+
+    default_hub = []
+
+    def __init__(self, hub=None, queue_size=None, **kwargs):
+        super().__init__(**kwargs)
+        self.hub = self.default_hub if hub is None else hub
+        self.queue_size = settings.CHAT_EVENT_BUS_QUEUE_SIZE if queue_size is None else queue_size
+        self._queue = None
+
+    def _listen(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        threading.Thread(target=self._receive_loop, args=(self._queue,), daemon=True).start()
+        self.hub.append(self)
+
+    def _receive_loop(self, events):
+        while True:
+            data = events.get()
+            if data is None:
+                return
+            self._dispatch(data)
+
+    def _send(self, data):
+        delivered = 0
+        for peer in list(self.hub):
+            if peer is self:
+                continue
+            try:
+                peer._queue.put_nowait(data)
+                delivered += 1
+            except queue.Full:
+                self.stats.count('dropped_full')
+        self.stats.count('sent', delivered)
+        return delivered
+
+    def stop(self):
+        if self._queue is not None:
+            self.hub.remove(self)
+            # Поток доставки мог заблокироваться в обработчике - не ждём его
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self._queue = None
+        self._handler = None
@@ -0,0 +1,99 @@
+import asyncio
+import re
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http import parse_cookie
+from django.http.request import split_domain_port, validate_host
+
+from .events import broker
+from .models import ChatRoom
+
+TEAM_CHAT_PATH = re.compile(r'^/ws/chat/(?P<team_id>\d+)/$')
+
+# Коды закрытия соединения (диапазон 4000-4999 отведён приложениям)
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+
+def _get_header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin1')
+    return ''
+
+
+def _origin_allowed(scope):
+    origin = _get_header(scope, b'origin')
+    if not origin:
+        # Не браузерный клиент
+        return True
+    host = origin.split('://', 1)[-1]
+    domain, port = split_domain_port(host)
+    return bool(domain) and validate_host(domain, settings.ALLOWED_HOSTS)
+
+
+@sync_to_async
+def _get_chat_room_id(scope, team_id):
+    """Возвращает id комнаты, если пользователь из cookie состоит в команде"""
+    cookies = parse_cookie(_get_header(scope, b'cookie'))
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    user = get_user(SimpleNamespace(session=session))
+    if not user.is_authenticated or user.team_id != team_id:
+        return None
+    chat_room, created = ChatRoom.objects.get_or_create(team_id=team_id)
+    return chat_room.id
+
+
+async def team_chat_websocket(scope, receive, send):
+    """WebSocket чата команды: /ws/chat/<team_id>/
+
+    Клиент только слушает, новые сообщения приходят сразу после
+    коммита в SendMessageView. Отправка остаётся через HTTP API.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    match = TEAM_CHAT_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    if not _origin_allowed(scope):
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    room_id = await _get_chat_room_id(scope, int(match.group('team_id')))
+    if room_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    subscription = broker.subscribe(room_id)
+    try:
+        await send({'type': 'websocket.accept'})
+        receive_task = asyncio.ensure_future(receive())
+        publish_task = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, pending = await asyncio.wait(
+                    {receive_task, publish_task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if receive_task in done:
+                    event = receive_task.result()
+                    if event['type'] == 'websocket.disconnect':
+                        break
+                    # Входящие кадры (ping от клиента) игнорируем
+                    receive_task = asyncio.ensure_future(receive())
+                if publish_task in done:
+                    await send({'type': 'websocket.send', 'text': publish_task.result()})
+                    publish_task = asyncio.ensure_future(subscription.get())
+        finally:
+            receive_task.cancel()
+            publish_task.cancel()
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Виды событий в шине между процессами
+MESSAGE, CHANGE = 1, 2
+
+# Клиент не успевал читать и пропустил события: пусть догрузит всё сам
+RESYNC = '{"type":"resync"}'
+
+
+class Subscription:
+    """Подписка одного клиента на события комнаты"""
+
+    def __init__(self, room_id, loop, queue_size=0):
+        self.room_id = room_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def put(self, payload):
+        """Вызывается в event loop подписчика; медленный клиент не копит память"""
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            payload = RESYNC
+        self.queue.put_nowait(payload)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class RoomBroker:
+    """Рассылка событий чата подписчикам внутри процесса.
+
+    publish() можно вызывать из любого потока (синхронные views),
+    доставка идёт в event loop подписчика через call_soon_threadsafe.
+    С первой подпиской процесс начинает принимать события других
+    процессов из bus, их передаёт remote_handler.
+    """
+
+    def __init__(self, bus=None, remote_handler=None, queue_size=0):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self.bus = bus
+        self.remote_handler = remote_handler
+        self.queue_size = queue_size
+
+    def subscribe(self, room_id):
+        if self.bus is not None:
+            self.bus.start(self.remote_handler)
+        subscription = Subscription(room_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions[room_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            room = self._subscriptions.get(subscription.room_id)
+            if room is None:
+                return
+            room.discard(subscription)
+            if not room:
+                del self._subscriptions[subscription.room_id]
+
+    def subscriber_count(self, room_id):
+        with self._lock:
+            return len(self._subscriptions.get(room_id, ()))
+
+    def publish(self, room_id, payload):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(room_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, payload)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self.unsubscribe(subscription)
+        return len(subscriptions)
+
+
+def _message_payload(fragment):
+    return (b'{"type":"message","message":' + fragment + b'}').decode()
+
+
+def _change_payload(seq):
+    return f'{{"type":"change","seq":{seq}}}'
+
+
+def _deliver_remote(room_id, kind, ref, body):
+    """Событие из другого процесса: сбрасываем свои кэши комнаты и рассылаем подписчикам"""
+    from .buffer import recent_messages
+
+    if kind == MESSAGE:
+        # Буфер догрузит сообщение из базы при следующем опросе
+        recent_messages.expire(room_id)
+        if not body:
+            from .fragments import chat_message_fragment
+            from .models import Message
+            message = Message.objects.select_related('author').filter(id=ref).first()
+            if message is None:
+                return
+            body = chat_message_fragment(message)
+        broker.publish(room_id, _message_payload(body))
+    elif kind == CHANGE:
+        recent_messages.forget(room_id)
+        broker.publish(room_id, _change_payload(ref))
+
+
+bus = import_string(settings.CHAT_EVENT_BUS)()
+broker = RoomBroker(bus, _deliver_remote, settings.CHAT_SUBSCRIBER_QUEUE_SIZE)
+
+
+def publish_message(room_id, fragment, message_id):
+    """Отправляет новое сообщение (готовый JSON) всем подключённым участникам комнаты"""
+    bus.publish(room_id, MESSAGE, message_id, fragment)
+    return broker.publish(room_id, _message_payload(fragment))
+
+
+def publish_change(room_id, seq):
+    """Сообщает участникам комнаты, что в ленте изменений появился номер seq"""
+    bus.publish(room_id, CHANGE, seq)
+    return broker.publish(room_id, _change_payload(seq))
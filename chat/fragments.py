@@ -0,0 +1,87 @@
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse
+
+
+def encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FragmentCache:
+    """JSON сообщений, закодированный один раз и хранимый как bytes (LRU).
+
+    Фрагмент хранится вместе с версией (updated_at): отредактированное
+    сообщение не совпадёт по версии и будет закодировано заново.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, fragment, version):
+        with self._lock:
+            self._fragments[key] = (version, fragment)
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._fragments.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+
+message_fragments = FragmentCache(settings.CHAT_FRAGMENT_CACHE_SIZE)
+
+
+def chat_message_fragment(message):
+    """JSON сообщения чата комнаты (chat.Message)"""
+    key = ('chat', message.id)
+    fragment = message_fragments.get(key, message.updated_at)
+    if fragment is None:
+        fragment = encode(message.to_dict())
+        message_fragments.set(key, fragment, message.updated_at)
+    return fragment
+
+
+def team_message_fragment(message, is_own):
+    """JSON сообщения teams.Message; is_own зависит от запроса, поэтому
+    в кэше лежит фрагмент без закрывающей скобки"""
+    key = ('teams', message.id)
+    prefix = message_fragments.get(key, message.created_at)
+    if prefix is None:
+        prefix = encode(message.to_dict())[:-1]
+        message_fragments.set(key, prefix, message.created_at)
+    return with_is_own(prefix, is_own)
+
+
+def with_is_own(prefix, is_own):
+    return prefix + (b',"is_own":true}' if is_own else b',"is_own":false}')
+
+
+def messages_response(fragments, has_more):
+    """Ответ {"messages": [...], "has_more": ...} склейкой готовых фрагментов"""
+    content = b''.join([
+        b'{"messages":[', b','.join(fragments),
+        b'],"has_more":', b'true' if has_more else b'false', b'}',
+    ])
+    return HttpResponse(content, content_type='application/json')
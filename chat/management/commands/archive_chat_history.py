@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from chat.archive import RoomArchive
+from chat.buffer import recent_messages
+from chat.fragments import chat_message_fragment, encode
+from chat.models import ChatRoom, Message, MessageChange
+from teams.models import Message as TeamMessage
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит сообщения старше отсечки из chat.Message и teams.Message '
+        'в сжатые сегменты архива (CHAT_ARCHIVE_ROOT) и удаляет их из базы. '
+        'Сообщения с вложениями остаются в базе, лента изменений старше '
+        'отсечки очищается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Архивировать сообщения старше N дней')
+        parser.add_argument('--before', help='Архивировать сообщения до даты YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать сообщения')
+
+    def handle(self, *args, **options):
+        cutoff = self.get_cutoff(options)
+        sources = [
+            # (вид архива, выборка, поле комнаты, JSON сообщения, учёт удалённых в комнате)
+            ('chat', Message.objects.filter(has_attachments=False), 'chat_room_id', chat_message_fragment,
+             ChatRoom.record_archived),
+            ('teams', TeamMessage.objects.all(), 'team_id', lambda msg: encode(msg.to_dict()), None),
+        ]
+        for kind, queryset, room_field, fragment, record_archived in sources:
+            queryset = queryset.filter(created_at__lt=cutoff)
+            room_ids = queryset.order_by().values_list(room_field, flat=True).distinct()
+            total = 0
+            for room_id in room_ids:
+                room_queryset = queryset.filter(**{room_field: room_id})
+                if options['dry_run']:
+                    total += room_queryset.count()
+                else:
+                    total += self.archive_room(
+                        RoomArchive(kind, room_id), room_queryset, fragment, options['batch_size'],
+                        record_archived and partial(record_archived, room_id),
+                    )
+                    if kind == 'chat':
+                        recent_messages.forget(room_id)
+                        MessageChange.prune(room_id, cutoff)
+            verb = 'будет перенесено' if options['dry_run'] else 'перенесено'
+            self.stdout.write(f'{kind}: {verb} {total} сообщений')
+
+    def get_cutoff(self, options):
+        if options['before']:
+            try:
+                day = datetime.strptime(options['before'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--before: ожидается дата YYYY-MM-DD')
+            return timezone.make_aware(day)
+        if options['days'] is not None:
+            return timezone.now() - timedelta(days=options['days'])
+        raise CommandError('Укажите --days или --before')
+
+    def archive_room(self, archive, queryset, fragment, batch_size, record_archived=None):
+        moved = 0
+        cursor = 0
+        while True:
+            messages = list(
+                queryset.filter(id__gt=cursor).select_related('author').order_by('id')[:batch_size]
+            )
+            if not messages:
+                return moved
+            cursor = messages[-1].id
+
+            # После сбоя между записью архива и удалением строки есть в обоих местах;
+            # строки старше архива, которых в нём нет, остаются в базе
+            last_id = archive.last_id
+            stale = [msg.id for msg in messages if msg.id <= last_id]
+            archived = archive.archived_ids(stale[0], stale[-1]) if stale else set()
+            fresh = [msg for msg in messages if msg.id > last_id]
+
+            archive.append([(msg.id, msg.author_id, fragment(msg)) for msg in fresh])
+            # Перенос в архив - не удаление: без сигналов и записей в ленту изменений,
+            # счётчики комнаты правятся одним запросом на пачку
+            ids = [msg.id for msg in fresh] + [msg_id for msg_id in stale if msg_id in archived]
+            with transaction.atomic():
+                deleted = queryset.model.objects.filter(id__in=ids)._raw_delete(queryset.db)
+                if record_archived is not None:
+                    record_archived(ids, deleted)
+            moved += len(fresh)
@@ -0,0 +1,85 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import User
+from chat.batching import MessageBatchWriter
+from chat.models import ChatRoom, Message
+from teams.models import Team
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность записи сообщений чата: '
+        'отдельная транзакция на сообщение против групповой записи. '
+        'Создаёт временную команду и удаляет её вместе с сообщениями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Одновременных отправителей')
+        parser.add_argument('--messages', type=int, default=50, help='Сообщений на отправителя')
+        parser.add_argument('--window', type=float, default=0.005, help='Окно групповой записи, сек')
+        parser.add_argument('--max-batch', type=int, default=100)
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(f'bench_{suffix}', password=uuid.uuid4().hex)
+        team = Team.objects.create(name=f'bench_{suffix}', leader=user)
+        room = ChatRoom.objects.create(team=team)
+        writer = MessageBatchWriter(window=options['window'], max_batch=options['max_batch'])
+
+        def direct(message):
+            # Та же работа, что у SendMessageView без пачек и у пачки на одно сообщение
+            with transaction.atomic():
+                message.save()
+                ChatRoom.record_messages([message])
+
+        try:
+            for name, write in (('direct', direct), ('batched', writer.submit)):
+                self.report(name, self.run(write, room, user, options['threads'], options['messages']))
+        finally:
+            # Каскадно удаляет команду, комнату и сообщения
+            user.delete()
+
+    def run(self, write, room, user, threads, per_thread):
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads + 1)
+
+        def sender(index):
+            own = []
+            try:
+                barrier.wait()
+                for i in range(per_thread):
+                    message = Message(chat_room=room, author=user, content=f'{index}-{i}')
+                    started = time.perf_counter()
+                    write(message)
+                    own.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(own)
+
+        workers = [threading.Thread(target=sender, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        return latencies, time.perf_counter() - started
+
+    def report(self, name, result):
+        latencies, elapsed = result
+        latencies.sort()
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        self.stdout.write(
+            f'{name:8} {len(latencies)} messages in {elapsed:.2f}s: '
+            f'{len(latencies) / elapsed:.0f} msg/s, '
+            f'p50 {statistics.median(latencies) * 1000:.1f} ms, '
+            f'p99 {percentile(0.99):.1f} ms'
+        )
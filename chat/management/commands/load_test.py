@@ -0,0 +1,287 @@
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.urls import reverse
+
+from accounts.models import User
+from chat.models import ChatRoom
+from teams.models import Team
+
+# Доля запросов каждого вида в смеси трафика
+TRAFFIC_MIX = {
+    'chat_poll': 60,
+    'chat_send': 10,
+    'team_list': 15,
+    'home': 15,
+}
+SEND_BURST = 3
+THINK_TIME = (0.05, 0.5)  # seconds, пауза участника между действиями
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: создаёт команды с участниками '
+        'и их сессии, затем участники опрашивают чат, отправляют сообщения '
+        'пачками и открывают список команд и главную. Печатает пропускную '
+        'способность, p50/p95/p99 и долю ошибок по каждому виду запросов; '
+        '--json сохраняет отчёт, --baseline сравнивает с прошлым отчётом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сервера')
+        parser.add_argument('--teams', type=int, default=20)
+        parser.add_argument('--members', type=int, default=5, help='Участников в команде')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность, сек')
+        parser.add_argument('--prefix', default='loadtest', help='Префикс имён пользователей и команд')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора смеси запросов')
+        parser.add_argument('--json', dest='json_path', help='Куда сохранить отчёт')
+        parser.add_argument('--baseline', help='Отчёт прошлого запуска для сравнения')
+        parser.add_argument(
+            '--max-regression', type=float, default=0.25,
+            help='Допустимый рост p95 относительно --baseline (0.25 = 25%%)'
+        )
+        parser.add_argument('--cleanup', action='store_true', help='Удалить созданные данные после теста')
+
+    def handle(self, *args, **options):
+        target = urlsplit(options['url'])
+        if target.scheme not in ('http', 'https') or not target.hostname:
+            raise CommandError(f'Unsupported --url: {options["url"]}')
+
+        teams = self.seed(options['prefix'], options['teams'], options['members'])
+        sessions = self.create_sessions(teams)
+        self.stdout.write(
+            f'{len(teams)} команд, {len(sessions)} участников, {options["duration"]:.0f} с нагрузки'
+        )
+        try:
+            results, elapsed = self.run(target, sessions, options['duration'], options['seed'])
+        finally:
+            if options['cleanup']:
+                self.cleanup(options['prefix'])
+
+        report = self.build_report(results, elapsed, len(sessions))
+        self.print_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['max_regression'])
+
+    # Подготовка данных
+
+    def seed(self, prefix, team_count, members_per_team):
+        """Команды prefix-team-N с участниками prefix-N-M; существующие не пересоздаются"""
+        password = make_password(None)
+        teams = []
+        with transaction.atomic():
+            for team_index in range(team_count):
+                usernames = [f'{prefix}-{team_index}-{m}' for m in range(members_per_team)]
+                existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+                User.objects.bulk_create([
+                    User(username=username, password=password)
+                    for username in usernames if username not in existing
+                ])
+                members = list(User.objects.filter(username__in=usernames).order_by('id'))
+                team, created = Team.objects.get_or_create(
+                    name=f'{prefix}-team-{team_index}',
+                    defaults={'leader': members[0], 'max_members': members_per_team},
+                )
+                User.objects.filter(id__in=[member.id for member in members]).update(team=team)
+                Team.objects.filter(id=team.id).update(member_count=len(members))
+                ChatRoom.objects.get_or_create(team=team)
+                teams.append((team, members))
+        return teams
+
+    def create_sessions(self, teams):
+        """Сессии входа напрямую в хранилище сессий, без хэширования паролей"""
+        engine = import_module(settings.SESSION_ENGINE)
+        backend = settings.AUTHENTICATION_BACKENDS[0]
+        sessions = []
+        for team, members in teams:
+            for member in members:
+                session = engine.SessionStore()
+                session[SESSION_KEY] = str(member.pk)
+                session[BACKEND_SESSION_KEY] = backend
+                session[HASH_SESSION_KEY] = member.get_session_auth_hash()
+                session.create()
+                sessions.append((team.id, session.session_key))
+        return sessions
+
+    def cleanup(self, prefix):
+        # Каскадно удаляет комнаты и сообщения
+        Team.objects.filter(name__startswith=f'{prefix}-team-').delete()
+        User.objects.filter(username__startswith=f'{prefix}-').delete()
+
+    # Нагрузка
+
+    def run(self, target, sessions, duration, seed):
+        results = defaultdict(list)  # вид запроса -> [(секунды, статус)]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+        paths = {
+            'team_list': reverse('teams:list'),
+            'home': reverse('news:home'),
+            'chat_send': reverse('chat:send_message'),
+        }
+
+        def member(index, team_id, session_key):
+            rng = random.Random(seed * 100003 + index)
+            client = _Client(target, {settings.SESSION_COOKIE_NAME: session_key})
+            poll_path = reverse('chat:get_messages', args=[team_id])
+            last_id = 0
+            own = []
+            try:
+                while time.monotonic() < deadline:
+                    kind = rng.choices(list(TRAFFIC_MIX), weights=TRAFFIC_MIX.values())[0]
+                    if kind == 'chat_poll':
+                        status, body, seconds = client.request('GET', f'{poll_path}?after_id={last_id}')
+                        own.append((kind, seconds, status))
+                        if status == 200:
+                            messages = json.loads(body).get('messages') or []
+                            if messages:
+                                last_id = max(last_id, messages[-1]['id'])
+                    elif kind == 'chat_send':
+                        for i in range(SEND_BURST):
+                            payload = json.dumps({'content': f'load {index}-{i}', 'team_id': team_id})
+                            status, body, seconds = client.request('POST', paths[kind], payload)
+                            own.append((kind, seconds, status))
+                    else:
+                        status, body, seconds = client.request('GET', paths[kind])
+                        own.append((kind, seconds, status))
+                    time.sleep(rng.uniform(*THINK_TIME))
+            finally:
+                client.close()
+                with lock:
+                    for kind, seconds, status in own:
+                        results[kind].append((seconds, status))
+
+        workers = [
+            threading.Thread(target=member, args=(index, team_id, session_key))
+            for index, (team_id, session_key) in enumerate(sessions)
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        connection.close()
+        return results, time.monotonic() - started
+
+    # Отчёт
+
+    def build_report(self, results, elapsed, users):
+        endpoints = {}
+        for kind in TRAFFIC_MIX:
+            samples = results.get(kind, [])
+            latencies = sorted(seconds * 1000 for seconds, status in samples)
+            # 429 - штатное ограничение частоты, считаем отдельно от ошибок
+            errors = sum(1 for seconds, status in samples if status == 0 or status >= 500)
+            throttled = sum(1 for seconds, status in samples if status == 429)
+            endpoints[kind] = {
+                'requests': len(samples),
+                'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+                'p50_ms': _round(percentile(latencies, 0.50)),
+                'p95_ms': _round(percentile(latencies, 0.95)),
+                'p99_ms': _round(percentile(latencies, 0.99)),
+                'max_ms': _round(latencies[-1] if latencies else None),
+                'error_rate': round(errors / len(samples), 4) if samples else 0,
+                'throttled_rate': round(throttled / len(samples), 4) if samples else 0,
+            }
+        return {'duration_s': round(elapsed, 2), 'users': users, 'endpoints': endpoints}
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"endpoint":10} {"requests":>8} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"errors":>7} {"429":>7}'
+        )
+        for kind, row in report['endpoints'].items():
+            self.stdout.write(
+                f'{kind:10} {row["requests"]:>8} {row["throughput_rps"]:>8} '
+                f'{_fmt(row["p50_ms"]):>8} {_fmt(row["p95_ms"]):>8} {_fmt(row["p99_ms"]):>8} '
+                f'{row["error_rate"]:>7.2%} {row["throttled_rate"]:>7.2%}'
+            )
+
+    def compare(self, report, baseline_path, max_regression):
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+        regressions = []
+        for kind, row in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(kind)
+            if not before or not before.get('p95_ms') or row['p95_ms'] is None:
+                continue
+            change = row['p95_ms'] / before['p95_ms'] - 1
+            self.stdout.write(f'{kind:10} p95 {before["p95_ms"]} -> {row["p95_ms"]} ms ({change:+.1%})')
+            if change > max_regression:
+                regressions.append(kind)
+            if row['error_rate'] > before.get('error_rate', 0):
+                regressions.append(f'{kind} errors')
+        if regressions:
+            raise CommandError(f'Regression against baseline: {", ".join(regressions)}')
+
+
+class _Client:
+    """HTTP-клиент одного участника: keep-alive соединение и cookie сессии"""
+
+    def __init__(self, target, cookies):
+        self.target = target
+        self.cookies = dict(cookies)
+        self.connection = None
+
+    def _connect(self):
+        connection_class = (
+            http.client.HTTPSConnection if self.target.scheme == 'https' else http.client.HTTPConnection
+        )
+        return connection_class(self.target.hostname, self.target.port, timeout=30)
+
+    def request(self, method, path, body=None):
+        """(статус, тело, секунды); статус 0 - сетевая ошибка"""
+        headers = {
+            'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items()),
+            'Host': self.target.netloc,
+        }
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = self._connect()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            for header, value in response.getheaders():
+                if header.lower() == 'set-cookie':
+                    name, _, rest = value.partition('=')
+                    self.cookies[name] = rest.split(';', 1)[0]
+            return response.status, data, time.perf_counter() - started
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, b'', time.perf_counter() - started
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:.1f}'
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import User
+from chat.models import ChatRoom, Message
+from teams.models import Team
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики: message_count, last_message '
+        'и last_activity_at у ChatRoom и member_count у Team. '
+        'Исправляет только записи с расхождениями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        messages = Message.objects.filter(chat_room=OuterRef('pk')).order_by('-id')
+        rooms = ChatRoom.objects.annotate(
+            actual_count=Coalesce(Subquery(
+                messages.order_by().values('chat_room').annotate(count=Count('id')).values('count')
+            ), 0),
+            actual_last_id=Subquery(messages.values('id')[:1]),
+            actual_last_at=Subquery(messages.values('created_at')[:1]),
+        )
+        drifted_rooms = []
+        for room in rooms:
+            if (room.message_count, room.last_message_id) != (room.actual_count, room.actual_last_id):
+                room.message_count = room.actual_count
+                room.last_message_id = room.actual_last_id
+                # Время активности не откатываем: сообщения могли уйти в архив
+                if room.actual_last_at and (
+                    room.last_activity_at is None or room.last_activity_at < room.actual_last_at
+                ):
+                    room.last_activity_at = room.actual_last_at
+                drifted_rooms.append(room)
+
+        teams = Team.objects.annotate(actual_count=Coalesce(Subquery(
+            User.objects.filter(team=OuterRef('pk')).order_by()
+            .values('team').annotate(count=Count('id')).values('count')
+        ), 0))
+        drifted_teams = []
+        for team in teams:
+            if team.member_count != team.actual_count:
+                team.member_count = team.actual_count
+                drifted_teams.append(team)
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                ChatRoom.objects.bulk_update(
+                    drifted_rooms, ['message_count', 'last_message', 'last_activity_at'], batch_size=500
+                )
+                Team.objects.bulk_update(drifted_teams, ['member_count'], batch_size=500)
+
+        verb = 'найдено' if options['dry_run'] else 'исправлено'
+        self.stdout.write(f'Комнат чата: {verb} {len(drifted_rooms)}, команд: {verb} {len(drifted_teams)}')
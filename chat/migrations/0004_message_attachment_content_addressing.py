@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:15
+
+import chat.attachments
+from django.db import migrations, models
+
+
+def mark_messages_with_attachments(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    MessageAttachment = apps.get_model('chat', 'MessageAttachment')
+    Message.objects.filter(
+        id__in=MessageAttachment.objects.values('message_id')
+    ).update(has_attachments=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_chat_msg_room_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='has_attachments',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='content_type',
+            field=models.CharField(default='application/octet-stream', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='size',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='messageattachment',
+            name='file',
+            field=models.FileField(max_length=255, storage=chat.attachments.ContentAddressedStorage(), upload_to=chat.attachments.attachment_upload_to),
+        ),
+        migrations.RunPython(mark_messages_with_attachments, migrations.RunPython.noop),
+    ]
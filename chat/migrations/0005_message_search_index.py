@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from hackathon_site.search import SearchIndex
+
+index = SearchIndex('chat_message', ['content'])
+
+
+def install_index(apps, schema_editor):
+    index.install(schema_editor.connection, rebuild=True)
+
+
+def uninstall_index(apps, schema_editor):
+    index.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_attachment_content_addressing'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, uninstall_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_readcursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='pruned_change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='MessageChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('message_id', models.IntegerField()),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'insert'), (2, 'edit'), (3, 'delete')])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat_room', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='changes', to='chat.chatroom')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='messagechange',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'seq'), name='chat_change_room_seq_uniq'),
+        ),
+    ]
@@ -1,16 +1,90 @@
-from django.db import models
+import os
+
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
+from django.urls import reverse
+
+from hackathon_site.search import SearchIndex
+from .attachments import ContentAddressedStorage, attachment_upload_to
+
+# team_id -> id комнаты; комната команды не меняется, поэтому кэшируем в процессе
+_team_room_ids = {}
 
 class ChatRoom(models.Model):
     id = models.AutoField(primary_key=True)
     team = models.OneToOneField('teams.Team', on_delete=models.CASCADE, related_name='chat_room')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Денормализованные поля: обновляются вместе с записью сообщений,
+    # расхождения исправляет manage.py reconcile_counters
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    message_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    # Последний номер в ленте изменений комнаты и номер, до которого лента удалена
+    change_seq = models.PositiveBigIntegerField(default=0)
+    pruned_change_seq = models.PositiveBigIntegerField(default=0)
     
     def __str__(self):
         return f"Chat for {self.team.name}"
     
     def get_last_message(self):
-        return self.messages.order_by('-created_at').first()
+        return self.last_message
+    
+    @classmethod
+    def record_messages(cls, messages):
+        """Учитывает новые сообщения в счётчиках комнат; вызывать в транзакции записи"""
+        rooms = {}
+        for message in messages:
+            count, last_id, last_at = rooms.get(message.chat_room_id, (0, 0, message.created_at))
+            rooms[message.chat_room_id] = (
+                count + 1, max(last_id, message.id), max(last_at, message.created_at)
+            )
+        for room_id, (count, last_id, last_at) in rooms.items():
+            # Greatest: параллельная запись более старого сообщения не откатит поля назад
+            MessageChange.record(
+                room_id,
+                [(message.id, MessageChange.INSERT) for message in messages if message.chat_room_id == room_id],
+                message_count=F('message_count') + count,
+                last_message_id=Greatest(
+                    Coalesce('last_message_id', 0), Value(last_id), output_field=models.IntegerField()
+                ),
+                last_activity_at=Greatest(Coalesce('last_activity_at', Value(last_at)), Value(last_at)),
+            )
+    
+    @classmethod
+    def record_archived(cls, room_id, message_ids, count):
+        """Учитывает count сообщений из message_ids, перенесённых в архив.
+
+        Строки удалены без сигналов, поэтому счётчик и последнее сообщение
+        комнаты правятся здесь одним UPDATE; вызывать в транзакции удаления.
+        """
+        cls.objects.filter(id=room_id).update(
+            message_count=Greatest(F('message_count') - count, 0),
+            last_message_id=Case(
+                When(last_message_id__in=message_ids, then=Subquery(
+                    Message.objects.filter(chat_room_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+                )),
+                default=F('last_message_id'),
+            ),
+        )
+    
+    @classmethod
+    def get_id_for_team(cls, team_id):
+        """id комнаты команды без загрузки Team; комната создаётся при первом обращении"""
+        room_id = _team_room_ids.get(team_id)
+        if room_id is None:
+            room_id = cls.objects.get_or_create(team_id=team_id)[0].id
+            # Внутри транзакции комната может откатиться - тогда не кэшируем
+            if not transaction.get_connection().in_atomic_block:
+                _team_room_ids[team_id] = room_id
+        return room_id
+    
+    @classmethod
+    def forget_team(cls, team_id):
+        _team_room_ids.pop(team_id, None)
 
 class Message(models.Model):
     chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
@@ -19,18 +93,130 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_edited = models.BooleanField(default=False)
+    # Чтобы сериализация не делала запрос за вложениями для обычных сообщений
+    has_attachments = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Курсорная выборка и long polling: WHERE chat_room_id = ? ORDER BY id
+            models.Index(fields=['chat_room', 'id'], name='chat_msg_room_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.author.username}: {self.content[:50]}..."
+    
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'content': self.content,
+            'author': self.author.username,
+            'created_at': self.created_at.strftime('%H:%M'),
+            'is_edited': self.is_edited
+        }
+        if self.has_attachments:
+            data['attachments'] = [attachment.to_dict() for attachment in self.attachments.all()]
+        return data
+
+class MessageChange(models.Model):
+    """Лента изменений комнаты: вставки, правки и удаления по порядку seq.
+
+    Номер выделяется обновлением ChatRoom.change_seq в транзакции записи,
+    строка комнаты заблокирована до коммита, поэтому изменения одной комнаты
+    становятся видны строго по возрастанию seq.
+    """
+    INSERT, EDIT, DELETE = 1, 2, 3
+    KIND_CHOICES = [(INSERT, 'insert'), (EDIT, 'edit'), (DELETE, 'delete')]
+    
+    # Без ограничения FK: удаления сообщений записываются, пока удаляется сама комната
+    chat_room = models.ForeignKey(
+        ChatRoom, on_delete=models.DO_NOTHING, db_constraint=False, related_name='changes'
+    )
+    seq = models.PositiveBigIntegerField()
+    message_id = models.IntegerField()
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat_room', 'seq'], name='chat_change_room_seq_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.message_id} (#{self.seq})"
+    
+    @classmethod
+    def record(cls, room_id, changes, **room_updates):
+        """Записывает [(message_id, kind)] и возвращает последний seq комнаты"""
+        rooms = ChatRoom.objects.filter(id=room_id)
+        with transaction.atomic():
+            rooms.update(change_seq=F('change_seq') + len(changes), **room_updates)
+            last_seq = rooms.values_list('change_seq', flat=True).first()
+            if last_seq is None:
+                return None
+            first_seq = last_seq - len(changes) + 1
+            cls.objects.bulk_create([
+                cls(chat_room_id=room_id, seq=first_seq + offset, message_id=message_id, kind=kind)
+                for offset, (message_id, kind) in enumerate(changes)
+            ])
+        return last_seq
+    
+    @classmethod
+    def prune(cls, room_id, before):
+        """Удаляет изменения старше before; клиентам с более старым seq нужна перезагрузка"""
+        old = cls.objects.filter(chat_room_id=room_id, created_at__lt=before)
+        last_pruned = old.aggregate(seq=models.Max('seq'))['seq']
+        if last_pruned is None:
+            return 0
+        with transaction.atomic():
+            deleted, _ = cls.objects.filter(chat_room_id=room_id, seq__lte=last_pruned).delete()
+            ChatRoom.objects.filter(id=room_id).update(
+                pruned_change_seq=Greatest('pruned_change_seq', Value(last_pruned))
+            )
+        return deleted
+
+# Полнотекстовый индекс по тексту сообщений (миграция 0005)
+message_search = SearchIndex(Message._meta.db_table, ['content'])
 
 class MessageAttachment(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to='chat_attachments/')
+    # Файл хранится под именем sha256 содержимого, одинаковые файлы - один раз на диске
+    file = models.FileField(upload_to=attachment_upload_to, storage=ContentAddressedStorage(), max_length=255)
     filename = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    size = models.BigIntegerField(default=0, editable=False)
+    content_type = models.CharField(max_length=100, default='application/octet-stream')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Attachment for message {self.message.id}"
+        return f"Attachment for message {self.message_id}"
+    
+    def save(self, *args, **kwargs):
+        if self.file and not self.size:
+            self.size = self.file.size
+        if not self.filename and self.file:
+            self.filename = os.path.basename(self.file.name)
+        super().save(*args, **kwargs)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'content_type': self.content_type,
+            'url': reverse('chat:attachment', args=[self.id]),
+        }
+
+class ReadCursor(models.Model):
+    """Докуда пользователь прочитал чат: один id сообщения на участника комнаты"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='read_cursors')
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    last_read_id = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'chat_room'], name='chat_read_cursor_user_room_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} read {self.chat_room_id} up to {self.last_read_id}"
@@ -0,0 +1,40 @@
+from django.conf import settings
+
+
+def _parse_id(params, name):
+    try:
+        value = int(params[name])
+    except (KeyError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def parse_cursor(params):
+    """Разбирает before_id, after_id (или старый last_id) и limit из GET"""
+    before_id = _parse_id(params, 'before_id')
+    after_id = _parse_id(params, 'after_id') or _parse_id(params, 'last_id')
+    limit = _parse_id(params, 'limit') or settings.CHAT_PAGE_SIZE
+    return before_id, after_id, min(limit, settings.CHAT_MAX_PAGE_SIZE)
+
+
+def get_cursor_page(queryset, before_id=None, after_id=None, limit=None):
+    """Страница сообщений по курсору id без OFFSET и COUNT.
+
+    after_id - самые старые сообщения новее курсора (догрузка новых),
+    before_id - самые новые сообщения старше курсора (история),
+    без курсора - последние limit сообщений.
+    Возвращает (сообщения по возрастанию id, есть ли ещё).
+    """
+    limit = limit or settings.CHAT_PAGE_SIZE
+
+    if after_id is not None:
+        rows = list(queryset.filter(id__gt=after_id).order_by('id')[:limit + 1])
+        return rows[:limit], len(rows) > limit
+
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    rows = list(queryset.order_by('-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
@@ -0,0 +1,145 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ChatRoom, Message, ReadCursor
+
+logger = logging.getLogger(__name__)
+
+
+def write_read_cursors(cursors):
+    """Продвигает курсоры {(user_id, room_id): message_id} одним upsert.
+
+    Курсор только растёт: запоздавшая запись меньшего id его не откатит.
+    """
+    if not cursors:
+        return
+    table = connection.ops.quote_name(ReadCursor._meta.db_table)
+    greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+    values = ', '.join(['(%s, %s, %s)'] * len(cursors))
+    params = [value for (user_id, room_id), message_id in cursors.items()
+              for value in (user_id, room_id, message_id)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, chat_room_id, last_read_id) VALUES {values} '
+            f'ON CONFLICT (user_id, chat_room_id) DO UPDATE SET '
+            f'last_read_id = {greatest}({table}.last_read_id, excluded.last_read_id)',
+            params
+        )
+
+
+class ReadCursorBatcher:
+    """Копит продвижение курсоров от отправленных сообщений.
+
+    Автор своё сообщение уже прочитал, но писать курсор на каждую отправку
+    дорого: накопленное уходит одним upsert, когда набралось max_pending
+    курсоров или прошло interval секунд с первого из них. Срок отсчитывает
+    таймер, так что курсоры записываются и в процессе, куда больше
+    никто не пишет. Пока курсор не записан, у автора могут числиться
+    непрочитанными чужие сообщения до его собственного. С interval = 0
+    курсор пишется сразу в потоке запроса, таймер не запускается.
+    """
+
+    def __init__(self, interval, max_pending):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._pending_since = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def advance(self, user_id, room_id, message_id):
+        key = (user_id, room_id)
+        if self.interval <= 0:
+            write_read_cursors({key: message_id})
+            return
+        with self._lock:
+            if message_id > self._pending.get(key, 0):
+                self._pending[key] = message_id
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+                self._timer = threading.Timer(self.interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+            due = (
+                len(self._pending) >= self.max_pending
+                or time.monotonic() - self._pending_since >= self.interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._reset()
+        write_read_cursors(pending)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Read cursor flush failed')
+        finally:
+            # Соединение потока таймера больше никому не нужно
+            connection.close()
+
+    def _reset(self):
+        self._pending_since = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def discard(self):
+        with self._lock:
+            self._pending.clear()
+            self._reset()
+
+
+read_cursor_batcher = ReadCursorBatcher(
+    interval=settings.CHAT_READ_CURSOR_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_READ_CURSOR_BATCH_SIZE,
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        read_cursor_batcher.flush()
+    except Exception:
+        pass
+
+
+def with_unread_counts(rooms, user):
+    """Добавляет комнатам unread - число чужих сообщений новее курсора пользователя.
+
+    Один запрос: курсор и счёт - подзапросы по индексам, счёт ограничен
+    CHAT_UNREAD_MAX самых новых сообщений комнаты.
+    """
+    cap = settings.CHAT_UNREAD_MAX
+    room_messages = Message.objects.filter(chat_room=OuterRef('pk'))
+    rooms = rooms.annotate(
+        last_read_id=Coalesce(Subquery(
+            ReadCursor.objects.filter(user_id=user.id, chat_room=OuterRef('pk')).values('last_read_id')[:1]
+        ), 0),
+        # Старше cap-го с конца сообщения не считаем
+        unread_floor=Coalesce(Subquery(room_messages.order_by('-id').values('id')[cap:cap + 1]), 0),
+    )
+    return rooms.annotate(unread=Coalesce(Subquery(
+        room_messages.filter(id__gt=Greatest(OuterRef('last_read_id'), OuterRef('unread_floor')))
+        .exclude(author_id=user.id)
+        .order_by().values('chat_room').annotate(count=Count('id')).values('count')
+    ), 0))
+
+
+def get_unread_counts(user):
+    """[(team_id, room_id, unread)] по комнатам, где состоит пользователь"""
+    if not user.team_id:
+        return []
+    rooms = with_unread_counts(ChatRoom.objects.filter(team_id=user.team_id), user)
+    return list(rooms.values_list('team_id', 'id', 'unread'))
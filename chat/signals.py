@@ -0,0 +1,49 @@
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .buffer import recent_messages
+from .fragments import message_fragments
+from .events import publish_change
+from .models import ChatRoom, Message, MessageChange, message_search
+
+
+def _record_change(message, kind):
+    seq = MessageChange.record(message.chat_room_id, [(message.id, kind)])
+    if seq is not None:
+        transaction.on_commit(lambda: publish_change(message.chat_room_id, seq))
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    # Новые сообщения SendMessageView пишет в буфер и ленту изменений сам
+    if not created:
+        message_fragments.invalidate(('chat', instance.id))
+        recent_messages.forget(instance.chat_room_id)
+        _record_change(instance, MessageChange.EDIT)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    message_fragments.invalidate(('chat', instance.id))
+    recent_messages.forget(instance.chat_room_id)
+    rooms = ChatRoom.objects.filter(id=instance.chat_room_id)
+    rooms.update(message_count=Greatest(F('message_count') - 1, 0))
+    # last_message обнулён через SET_NULL - берём предыдущее сообщение
+    rooms.filter(last_message__isnull=True).update(last_message_id=Subquery(
+        Message.objects.filter(chat_room_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+    ))
+    _record_change(instance, MessageChange.DELETE)
+
+
+@receiver(post_delete, sender=ChatRoom)
+def chat_room_deleted(sender, instance, **kwargs):
+    ChatRoom.forget_team(instance.team_id)
+    MessageChange.objects.filter(chat_room_id=instance.id).delete()
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    # Пересоздание таблицы в миграциях SQLite удаляет триггеры полнотекстового индекса
+    message_search.restore_triggers(connections[using])
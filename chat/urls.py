@@ -9,4 +9,12 @@ urlpatterns = [
     path('team/<int:team_id>/', views.TeamChatView.as_view(), name='team_chat'),
     path('api/send/', views.SendMessageView, name='send_message'),
     path('api/messages/<int:team_id>/', views.GetMessagesView, name='get_messages'),
+    path('api/changes/<int:team_id>/', views.MessageChangesView, name='changes'),
+    path('api/search/', views.SearchMessagesView, name='search'),
+    path('api/unread/', views.UnreadCountsView, name='unread'),
+    path('api/read/', views.MarkReadView, name='mark_read'),
+    path('api/buffer-stats/', views.BufferStatsView, name='buffer_stats'),
+    path('api/bus-stats/', views.EventBusStatsView, name='bus_stats'),
+    path('api/attachments/upload/', views.UploadAttachmentView, name='upload_attachment'),
+    path('attachments/<int:attachment_id>/', views.AttachmentDownloadView, name='attachment'),
 ]
\ No newline at end of file
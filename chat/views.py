@@ -1,13 +1,31 @@
 from django.shortcuts import render, get_object_or_404
-from django.views.generic import ListView
+from django.views.generic import ListView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.contrib.auth.views import redirect_to_login
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_etags
+from django.db import transaction
+from django.conf import settings
+from asgiref.sync import sync_to_async
+import asyncio
 import json
-from .models import ChatRoom, Message
+from .events import broker, bus, publish_message
+from .archive import RoomArchive
+from .attachments import HashingFileUploadHandler, aiter_file_range, iter_file_range, parse_range
+from .batching import batch_writer
+from .buffer import recent_messages
+from .fragments import chat_message_fragment, encode, messages_response
+from .models import ChatRoom, Message, MessageAttachment, MessageChange, message_search
+from .pagination import get_cursor_page, parse_cursor
+from .read_cursors import get_unread_counts, read_cursor_batcher, with_unread_counts, write_read_cursors
+from hackathon_site.ratelimit import check_rate_limit, rate_limit
 from teams.models import Team
+from teams.snapshot import team_snapshots
 
 class ChatListView(LoginRequiredMixin, ListView):
     model = ChatRoom
@@ -16,40 +34,59 @@ class ChatListView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         user = self.request.user
-        if user.team:
-            return ChatRoom.objects.filter(team=user.team).select_related('team')
+        if user.team_id:
+            return with_unread_counts(
+                ChatRoom.objects.filter(team_id=user.team_id).select_related('team', 'last_message__author'),
+                user
+            )
         return ChatRoom.objects.none()
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['unread_max'] = settings.CHAT_UNREAD_MAX
+        snapshot = team_snapshots.get(self.request.user.team_id) if self.request.user.team_id else None
+        if snapshot is not None:
+            context['team'] = snapshot.team
+            context['members'] = snapshot.members
+        return context
 
-class TeamChatView(LoginRequiredMixin, ListView):
-    model = Message
+class TeamChatView(LoginRequiredMixin, TemplateView):
+    """Страница чата: сообщения подгружаются клиентом через курсорный API"""
     template_name = 'chat/team_chat.html'
-    context_object_name = 'messages'
-    paginate_by = 50
     
     def dispatch(self, request, *args, **kwargs):
         team_id = kwargs.get('team_id')
-        team = get_object_or_404(Team, id=team_id)
+        # Команда и участники из кэшированного снимка, без запросов на каждый показ
+        snapshot = team_snapshots.get(team_id)
+        if snapshot is None:
+            raise Http404('Команда не найдена')
         
-        if request.user.team != team:
+        if request.user.team_id != snapshot.team.id:
             return render(request, 'chat/no_access.html')
         
-        self.team = team
-        self.chat_room, created = ChatRoom.objects.get_or_create(team=team)
+        self.snapshot = snapshot
+        self.team = snapshot.team
+        self.chat_room, created = ChatRoom.objects.get_or_create(team=self.team)
         return super().dispatch(request, *args, **kwargs)
     
-    def get_queryset(self):
-        return Message.objects.filter(
-            chat_room=self.chat_room
-        ).select_related('author').order_by('created_at')
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['team'] = self.team
+        context['members'] = self.snapshot.members
         context['chat_room'] = self.chat_room
         return context
 
+def _on_message_created(message):
+    # Сразу после коммита: пишем в буфер и рассылаем по WebSocket
+    fragment = chat_message_fragment(message)
+    recent_messages.add(message.chat_room_id, message.id, fragment)
+    publish_message(message.chat_room_id, fragment, message.id)
+    # Автор прочитал чат до своего сообщения; курсоры пишутся пачками
+    read_cursor_batcher.advance(message.author_id, message.chat_room_id, message.id)
+
 @csrf_exempt
 @login_required
+@rate_limit('send')
 def SendMessageView(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
@@ -62,69 +99,369 @@ def SendMessageView(request):
         if not content:
             return JsonResponse({'error': 'Message content is required'}, status=400)
         
-        team = get_object_or_404(Team, id=team_id)
+        try:
+            team_id = int(team_id)
+        except (TypeError, ValueError):
+            team_id = None
         
-        if request.user.team != team:
+        # Участник своей команды: Team загружать не нужно
+        if team_id is None or request.user.team_id != team_id:
+            get_object_or_404(Team, id=team_id)
             return JsonResponse({'error': 'Access denied'}, status=403)
         
-        chat_room, created = ChatRoom.objects.get_or_create(team=team)
-        
-        message = Message.objects.create(
-            chat_room=chat_room,
+        message = Message(
+            chat_room_id=ChatRoom.get_id_for_team(team_id),
             author=request.user,
             content=content
         )
         
-        return JsonResponse({
-            'success': True,
-            'message': {
-                'id': message.id,
-                'content': message.content,
-                'author': message.author.username,
-                'created_at': message.created_at.strftime('%H:%M'),
-                'is_edited': message.is_edited
-            }
-        })
+        if settings.CHAT_BATCH_WRITES:
+            # Пачка уже закоммичена, когда submit() вернул сообщение
+            message = batch_writer.submit(message)
+            _on_message_created(message)
+        else:
+            with transaction.atomic():
+                message.save()
+                ChatRoom.record_messages([message])
+            transaction.on_commit(lambda: _on_message_created(message))
+        
+        return HttpResponse(
+            b'{"success":true,"message":' + chat_message_fragment(message) + b'}',
+            content_type='application/json'
+        )
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-# ИСПРАВЛЕНО: одна @ вместо двух @@
+@csrf_exempt
 @login_required
-def GetMessagesView(request, team_id):
-    team = get_object_or_404(Team, id=team_id)
+@rate_limit('send')
+def UploadAttachmentView(request):
+    """Загрузка файла в чат команды (multipart: file, team_id, content).
     
-    if request.user.team != team:
-        return JsonResponse({'error': 'Access denied'}, status=403)
+    Файл пишется кусками во временный файл с подсчётом sha256, затем
+    переносится в хранилище по хэшу содержимого. Анонимам и превысившим
+    лимит отвечаем до чтения тела.
+    """
+    # Обработчик загрузки меняем до чтения тела: CSRF-проверка тоже читает POST
+    upload_handler = HashingFileUploadHandler(request)
+    request.upload_handlers = [upload_handler]
+    return _upload_attachment(request, upload_handler)
+
+@csrf_protect
+def _upload_attachment(request, upload_handler):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
     
-    chat_room, created = ChatRoom.objects.get_or_create(team=team)
+    upload = request.FILES.get('file')
+    if upload is None:
+        if getattr(upload_handler, 'received', 0) > settings.CHAT_ATTACHMENT_MAX_SIZE:
+            return JsonResponse({'error': 'File is too large'}, status=413)
+        return JsonResponse({'error': 'File is required'}, status=400)
     
-    # Получаем параметр last_id для оптимизации
-    last_id = request.GET.get('last_id', 0)
     try:
-        last_id = int(last_id)
-    except:
-        last_id = 0
-    
-    # Загружаем только новые сообщения
-    if last_id > 0:
-        messages = Message.objects.filter(
-            chat_room=chat_room,
-            id__gt=last_id
-        ).select_related('author').order_by('id')
+        team_id = int(request.POST.get('team_id'))
+    except (TypeError, ValueError):
+        team_id = None
+    if team_id is None or request.user.team_id != team_id:
+        get_object_or_404(Team, id=team_id)
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    with transaction.atomic():
+        message = Message.objects.create(
+            chat_room_id=ChatRoom.get_id_for_team(team_id),
+            author=request.user,
+            content=request.POST.get('content', '').strip() or upload.name,
+            has_attachments=True
+        )
+        MessageAttachment.objects.create(
+            message=message,
+            file=upload,
+            filename=upload.name[:255],
+            size=upload.size,
+            content_type=upload.content_type or 'application/octet-stream'
+        )
+        ChatRoom.record_messages([message])
+    transaction.on_commit(lambda: _on_message_created(message))
+    
+    return HttpResponse(
+        b'{"success":true,"message":' + chat_message_fragment(message) + b'}',
+        content_type='application/json'
+    )
+
+@login_required
+def AttachmentDownloadView(request, attachment_id):
+    """Скачивание вложения потоком с поддержкой Range и условных запросов"""
+    attachment = get_object_or_404(
+        MessageAttachment.objects.select_related('message__chat_room'), id=attachment_id
+    )
+    if request.user.team_id != attachment.message.chat_room.team_id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    # Имя файла - хэш содержимого, поэтому ETag строгий и не меняется
+    etag = f'"{attachment.sha256}"' if attachment.sha256 else None
+    last_modified = int(attachment.uploaded_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+    
+    size = attachment.size or attachment.file.size
+    start, end = 0, size - 1
+    status = 200
+    
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range in (etag, http_date(last_modified))):
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+    
+    file = attachment.file.storage.open(attachment.file.name, 'rb')
+    if isinstance(request, ASGIRequest):
+        # Под ASGI только асинхронный итератор отдаётся кусками
+        response = StreamingHttpResponse(
+            aiter_file_range(file, start, end - start + 1),
+            status=status,
+            content_type=attachment.content_type
+        )
+    elif status == 200:
+        # Файл целиком: WSGI-сервер может отдать его через wsgi.file_wrapper
+        response = FileResponse(file, content_type=attachment.content_type)
     else:
-        messages = Message.objects.filter(
-            chat_room=chat_room
-        ).select_related('author').order_by('id')
-    
-    messages_data = [{
-        'id': msg.id,
-        'content': msg.content,
-        'author': msg.author.username,
-        'created_at': msg.created_at.strftime('%H:%M'),
-        'is_edited': msg.is_edited
-    } for msg in messages]
-    
-    return JsonResponse({'messages': messages_data})
\ No newline at end of file
+        response = StreamingHttpResponse(
+            iter_file_range(file, start, end - start + 1),
+            status=status,
+            content_type=attachment.content_type
+        )
+    response['Content-Length'] = end - start + 1
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(True, attachment.filename)
+    response['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=86400)
+    return response
+
+def _get_room_id_for_poll(request, team_id):
+    """Проверяет доступ и возвращает (ответ с ошибкой, id комнаты)"""
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path()), None
+    
+    # Участник своей команды: Team загружать не нужно
+    if request.user.team_id != team_id:
+        get_object_or_404(Team, id=team_id)
+        return JsonResponse({'error': 'Access denied'}, status=403), None
+    
+    return check_rate_limit(request, 'poll'), ChatRoom.get_id_for_team(team_id)
+
+def _build_messages_response(request, room_id, before_id, after_id, limit):
+    # Правка и удаление не меняют последний id - в ETag и номер ленты изменений
+    latest_id, change_seq = recent_messages.get_version(room_id)
+    etag = f'"{latest_id}.{change_seq}"'
+    
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    elif after_id is not None and latest_id <= after_id:
+        # Пустой опрос не трогает таблицу сообщений второй раз
+        response = JsonResponse({'messages': [], 'has_more': False})
+    else:
+        # Новые сообщения отдаём из буфера, историю и старые курсоры - из базы,
+        # а то, что старше отсечки archive_chat_history, - из архива
+        archive = RoomArchive('chat', room_id)
+        page = None
+        if before_id is None and (after_id is not None or not archive.last_id):
+            page = recent_messages.get_page(room_id, after_id, limit)
+        if page is not None:
+            fragments, has_more, _ = page
+        else:
+            messages, has_more = get_cursor_page(
+                Message.objects.filter(chat_room_id=room_id).select_related('author'),
+                before_id=before_id, after_id=after_id, limit=limit
+            )
+            rows = [(msg.id, msg.author_id, chat_message_fragment(msg)) for msg in messages]
+            if after_id is None:
+                rows, has_more = archive.merge_page(rows, has_more, before_id, limit)
+            fragments = [fragment for message_id, author_id, fragment in rows]
+        response = messages_response(fragments, has_more)
+    
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+async def GetMessagesView(request, team_id):
+    """Сообщения комнаты по курсору.
+    
+    Без параметров - последние limit сообщений, before_id - история,
+    after_id (или last_id) - новые сообщения. С параметром wait=<секунды>
+    запрос новых ждёт сообщения (long polling), но не дольше
+    CHAT_LONG_POLL_MAX_WAIT.
+    """
+    error_response, room_id = await sync_to_async(_get_room_id_for_poll)(request, team_id)
+    if error_response is not None:
+        return error_response
+    
+    before_id, after_id, limit = parse_cursor(request.GET)
+    
+    try:
+        wait = int(request.GET.get('wait', 0))
+    except ValueError:
+        wait = 0
+    wait = min(max(wait, 0), settings.CHAT_LONG_POLL_MAX_WAIT)
+    
+    if wait and before_id is None:
+        # Подписываемся до проверки, чтобы не пропустить сообщение между ними
+        subscription = broker.subscribe(room_id)
+        try:
+            if await sync_to_async(recent_messages.get_latest_id)(room_id) <= (after_id or 0):
+                try:
+                    await asyncio.wait_for(subscription.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            broker.unsubscribe(subscription)
+    
+    return await sync_to_async(_build_messages_response)(
+        request, room_id, before_id, after_id, limit
+    )
+
+
+@login_required
+def SearchMessagesView(request):
+    """Полнотекстовый поиск по чату своей команды, по релевантности"""
+    if not request.user.team_id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    query = request.GET.get('q', '').strip()
+    messages, next_cursor = [], None
+    if query:
+        messages, next_cursor = message_search.search(
+            Message.objects.filter(
+                chat_room_id=ChatRoom.get_id_for_team(request.user.team_id)
+            ).select_related('author'),
+            query,
+            cursor=request.GET.get('cursor'),
+            limit=settings.SEARCH_PAGE_SIZE
+        )
+    
+    content = b''.join([
+        b'{"results":[', b','.join(chat_message_fragment(msg) for msg in messages),
+        b'],"next_cursor":', encode(next_cursor), b'}',
+    ])
+    return HttpResponse(content, content_type='application/json')
+
+@login_required
+@rate_limit('poll')
+def MessageChangesView(request, team_id):
+    """Лента изменений комнаты после номера since: вставки, правки, удаления.
+    
+    Для вставок и правок отдаётся текущее состояние сообщения. Если нужная
+    часть ленты уже очищена, ответ {"reset": true} - клиент перезагружает чат.
+    """
+    if request.user.team_id != team_id:
+        get_object_or_404(Team, id=team_id)
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    room_id = ChatRoom.get_id_for_team(team_id)
+    change_seq, pruned_change_seq = ChatRoom.objects.filter(id=room_id).values_list(
+        'change_seq', 'pruned_change_seq'
+    ).get()
+    try:
+        since = max(int(request.GET.get('since', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'since must be an integer'}, status=400)
+    try:
+        limit = int(request.GET.get('limit', settings.CHAT_PAGE_SIZE) or settings.CHAT_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    limit = min(max(limit, 1), settings.CHAT_MAX_PAGE_SIZE)
+    
+    if since < pruned_change_seq:
+        return JsonResponse({'reset': True, 'seq': change_seq})
+    if since >= change_seq:
+        return JsonResponse({'changes': [], 'seq': change_seq, 'has_more': False})
+    
+    changes = list(
+        MessageChange.objects.filter(chat_room_id=room_id, seq__gt=since).order_by('seq')[:limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    messages = Message.objects.select_related('author').in_bulk(
+        [change.message_id for change in changes if change.kind != MessageChange.DELETE]
+    )
+    
+    items = []
+    for change in changes:
+        message = messages.get(change.message_id)
+        items.append(b'{"seq":%d,"type":"%s","id":%d,"message":%s}' % (
+            change.seq, change.get_kind_display().encode(), change.message_id,
+            chat_message_fragment(message) if message is not None else b'null',
+        ))
+    content = b''.join([
+        b'{"changes":[', b','.join(items),
+        # Строки могли удалить без сдвига pruned_change_seq - тогда догоняем до change_seq
+        b'],"seq":', str(changes[-1].seq if changes else change_seq).encode(),
+        b',"has_more":', b'true' if has_more else b'false', b'}',
+    ])
+    return HttpResponse(content, content_type='application/json')
+
+@login_required
+def UnreadCountsView(request):
+    """Непрочитанные сообщения по всем комнатам пользователя одним запросом"""
+    rooms = [
+        {'team_id': team_id, 'room_id': room_id, 'unread': unread}
+        for team_id, room_id, unread in get_unread_counts(request.user)
+    ]
+    return JsonResponse({
+        'rooms': rooms,
+        'total': sum(room['unread'] for room in rooms),
+        'max': settings.CHAT_UNREAD_MAX,
+    })
+
+@login_required
+def MarkReadView(request):
+    """Отмечает чат команды прочитанным до message_id"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        team_id = int(data.get('team_id'))
+        message_id = int(data.get('message_id'))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'error': 'team_id and message_id are required'}, status=400)
+    
+    if request.user.team_id != team_id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    room = ChatRoom.objects.filter(team_id=team_id).values_list('id', 'last_message_id').first()
+    if room is None:
+        return JsonResponse({'error': 'Chat not found'}, status=404)
+    room_id, last_message_id = room
+    # Курсор не может уйти дальше последнего сообщения комнаты
+    message_id = min(message_id, last_message_id or 0)
+    if message_id > 0:
+        write_read_cursors({(request.user.id, room_id): message_id})
+    return JsonResponse({'success': True, 'last_read_id': message_id})
+
+@login_required
+def EventBusStatsView(request):
+    """Задержка доставки событий из других процессов и число потерянных событий"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return JsonResponse(bus.stats.snapshot())
+
+@login_required
+def BufferStatsView(request):
+    """Счётчики буфера сообщений текущего процесса для подбора его размера"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return JsonResponse(recent_messages.stats())
@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import wait as wait_futures
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from PIL import Image, ImageOps
+
+from .pools import SharedPool
+
+logger = logging.getLogger(__name__)
+
+# Все варианты изображения записаны: sender - модель, name - имя оригинала
+variants_ready = Signal()
+
+WEBP = ('WEBP', 'webp')
+QUALITY = 82
+
+
+def fallback_format(name):
+    """Формат вариантов для браузеров без WebP: PNG сохраняет прозрачность"""
+    return ('PNG', 'png') if name.lower().endswith('.png') else ('JPEG', 'jpg')
+
+
+def variant_name(name, width, extension):
+    """news/photo.jpg -> news/photo.640w.webp: рядом с оригиналом, без случайных суффиксов"""
+    return f'{os.path.splitext(name)[0]}.{width}w.{extension}'
+
+
+def variant_names(name, widths):
+    """[(ширина, формат, имя)] в порядке записи: последний вариант - признак готовности"""
+    return [
+        (width, format, variant_name(name, width, extension))
+        for width in sorted(widths)
+        for format, extension in (fallback_format(name), WEBP)
+    ]
+
+
+def _resize(image, width):
+    if image.width <= width:
+        return image
+    return image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+
+
+def generate_variants(name, widths):
+    """Записывает недостающие варианты оригинала name, возвращает их имена.
+
+    Выполняется в процессе пула. Ширина больше оригинальной не увеличивает
+    картинку, но вариант всё равно пишется, чтобы набор имён был одинаковым.
+    """
+    with default_storage.open(name) as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    created = []
+    for width, format, variant in variant_names(name, widths):
+        if default_storage.exists(variant):
+            continue
+        resized = _resize(image, width)
+        if format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+            resized = resized.convert('RGB')
+        buffer = BytesIO()
+        resized.save(buffer, format, quality=QUALITY, optimize=True)
+        saved = default_storage.save(variant, ContentFile(buffer.getvalue()))
+        if saved != variant:
+            # Другой процесс успел записать тот же вариант - наш дубль не нужен
+            default_storage.delete(saved)
+        created.append(variant)
+    return created
+
+
+class ImageVariants:
+    """Уменьшенные копии загруженных изображений (исходный формат и WebP).
+
+    Варианты пишутся после коммита загрузки в общем пуле процессов
+    (запуск через spawn, закрывается при выходе), под предсказуемыми
+    именами рядом с оригиналом. widths - {'app.Model.поле': ширины}.
+    Пока варианты не готовы, шаблоны показывают оригинал; готовность
+    проверяется по последнему варианту и запоминается в процессе, а его
+    отсутствие - на missing_ttl секунд, чтобы не обращаться к хранилищу
+    на каждом рендере. Старые изображения без вариантов догоняет
+    manage.py generate_image_variants.
+    """
+
+    def __init__(self, widths, workers, missing_ttl=60):
+        self.widths = widths
+        self.pool = SharedPool(workers)
+        self.missing_ttl = missing_ttl
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ready = set()
+        # имя -> время (monotonic), до которого не проверяем хранилище снова
+        self._missing = {}
+
+    def widths_for(self, fieldfile):
+        field = fieldfile.field
+        return self.widths.get(f'{field.model._meta.label}.{field.name}')
+
+    def variants(self, fieldfile):
+        """{'fallback': [(url, ширина)], 'webp': [...]} или None, если вариантов ещё нет"""
+        widths = self.widths_for(fieldfile)
+        if not fieldfile or not widths:
+            return None
+        names = variant_names(fieldfile.name, widths)
+        if fieldfile.name not in self._ready:
+            if fieldfile.name in self._pending or self._missing.get(fieldfile.name, 0) > time.monotonic():
+                return None
+            if not default_storage.exists(names[-1][2]):
+                self._missing[fieldfile.name] = time.monotonic() + self.missing_ttl
+                return None
+            self._missing.pop(fieldfile.name, None)
+            self._ready.add(fieldfile.name)
+        variants = {'fallback': [], 'webp': []}
+        for width, format, name in names:
+            variants['webp' if format == WEBP[0] else 'fallback'].append((default_storage.url(name), width))
+        return variants
+
+    def schedule(self, fieldfile):
+        """Ставит генерацию вариантов в пул, возвращает Future или None"""
+        widths = self.widths_for(fieldfile)
+        if not fieldfile or not widths:
+            return None
+        name, model = fieldfile.name, fieldfile.field.model
+        with self._lock:
+            if name in self._ready:
+                return None
+            if name in self._pending:
+                return self._pending[name][0]
+            future = self.pool.submit(generate_variants, name, widths)
+            self._pending[name] = (future, model)
+        future.add_done_callback(lambda future: self._done(name))
+        return future
+
+    def schedule_on_commit(self, fieldfile):
+        if fieldfile and self.widths_for(fieldfile):
+            transaction.on_commit(lambda: self.schedule(fieldfile))
+
+    def _done(self, name):
+        with self._lock:
+            # Вызывается из пула и из wait(): обрабатываем один раз
+            future, model = self._pending.get(name, (None, None))
+            if future is None or not future.done():
+                return
+            del self._pending[name]
+            # exception() у отменённой задачи (выход процесса) бросает CancelledError
+            succeeded = not future.cancelled() and future.exception() is None
+            if succeeded:
+                self._ready.add(name)
+                self._missing.pop(name, None)
+        if future.cancelled():
+            logger.warning('Image variants for %s cancelled', name)
+        elif not succeeded:
+            logger.warning('Image variants for %s failed: %s', name, future.exception())
+        else:
+            variants_ready.send(sender=model, name=name)
+
+    def mark_ready(self, name):
+        with self._lock:
+            self._ready.add(name)
+            self._missing.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._ready.clear()
+            self._missing.clear()
+
+    def wait(self, timeout=None):
+        """Дождаться всех поставленных генераций (команды, тесты)"""
+        with self._lock:
+            pending = {name: future for name, (future, model) in self._pending.items()}
+        wait_futures(pending.values(), timeout=timeout)
+        for name in pending:
+            # Колбэк пула мог ещё не отработать
+            self._done(name)
+
+
+image_variants = ImageVariants(
+    widths=settings.IMAGE_VARIANT_WIDTHS,
+    workers=settings.IMAGE_VARIANTS_WORKERS,
+    missing_ttl=settings.IMAGE_VARIANTS_MISSING_TTL,
+)
+
+
+@receiver(variants_ready)
+def variants_written(sender, name, **kwargs):
+    # Варианты могли записать в обход пула (generate_image_variants) - не ждём missing_ttl
+    image_variants.mark_ready(name)
@@ -0,0 +1,60 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+
+
+def _init_worker():
+    # Процесс пула начинает с чистого интерпретатора
+    django.setup()
+
+
+def spawn_pool(workers=None):
+    """Пул процессов, запущенных через spawn, с настроенным Django.
+
+    fork скопировал бы веб-процесс целиком: соединения с БД, потоки event
+    loop и захваченные блокировки, которые в потомке никто не отпустит.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+    )
+
+
+class SharedPool:
+    """Пул процесса, общий для запросов: создаётся при первой задаче,
+    закрывается при выходе, после падения воркера пересоздаётся.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = spawn_pool(self.workers)
+            atexit.register(self._executor.shutdown, wait=False, cancel_futures=True)
+        return self._executor
+
+    def submit(self, fn, *args):
+        with self._lock:
+            try:
+                return self._pool().submit(fn, *args)
+            except BrokenProcessPool:
+                # Упавший процесс ломает весь пул - создаём новый
+                self._executor = None
+                return self._pool().submit(fn, *args)
+
+    def map(self, fn, *iterables, chunksize=1):
+        with self._lock:
+            pool = self._pool()
+        try:
+            return list(pool.map(fn, *iterables, chunksize=chunksize))
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is pool:
+                    self._executor = None
+            raise
@@ -25,6 +25,12 @@ if 'DATABASE_URL' in os.environ:
         'default': dj_database_url.parse(os.environ.get('DATABASE_URL'))
     }
 
+# Несколько воркеров gunicorn: события чата рассылаются через Unix-сокеты
+CHAT_EVENT_BUS = os.environ.get('CHAT_EVENT_BUS', 'chat.bus.UnixSocketEventBus')
+
+# Лимиты запросов к чату общие для всех воркеров
+RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE', '/tmp/hackathon-ratelimit')
+
 # Security settings
 SECURE_SSL_REDIRECT = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
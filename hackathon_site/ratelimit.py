@@ -0,0 +1,129 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+
+# Слот таблицы: хэш ключа (0 - свободен), токены, время последнего обновления
+SLOT = struct.Struct('<Qdd')
+
+# Сколько соседних слотов проверять, прежде чем вытеснить самый старый
+PROBES = 8
+
+
+class TokenBucketLimiter:
+    """Token bucket по ключам в общей памяти.
+
+    Таблица слотов фиксированного размера отображена в память: при
+    RATE_LIMIT_FILE её делят все процессы хоста (запись под flock),
+    без файла - только потоки одного процесса. Переполнение таблицы
+    вытесняет самый давно обновлённый слот, то есть самый полный бакет.
+    """
+
+    def __init__(self, path=None, slots=None):
+        self.path = path
+        self.slots = slots
+        self._map = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        slots = self.slots or settings.RATE_LIMIT_SLOTS
+        size = slots * SLOT.size
+        if self.path:
+            self._file = open(self.path, 'a+b')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._file.fileno()).st_size < size:
+                    self._file.truncate(size)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        else:
+            self._map = mmap.mmap(-1, size)
+        self.slots = slots
+
+    def _find_slot(self, key_hash):
+        start = key_hash % self.slots
+        oldest, oldest_at = start, math.inf
+        for probe in range(PROBES):
+            position = (start + probe) % self.slots
+            slot_hash, tokens, updated_at = SLOT.unpack_from(self._map, position * SLOT.size)
+            if slot_hash == key_hash or slot_hash == 0:
+                return position, slot_hash == key_hash, tokens, updated_at
+            if updated_at < oldest_at:
+                oldest, oldest_at = position, updated_at
+        return oldest, False, 0.0, 0.0
+
+    def consume(self, key, rate, burst, now=None):
+        """Берёт токен из бакета key; 0 - можно, иначе сколько секунд ждать"""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._map is None:
+                self._open()
+            if self._file is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                position, found, tokens, updated_at = self._find_slot(key_hash)
+                if found:
+                    tokens = min(burst, tokens + max(now - updated_at, 0) * rate)
+                else:
+                    tokens = burst
+                if tokens >= 1:
+                    tokens -= 1
+                    retry_after = 0.0
+                else:
+                    retry_after = (1 - tokens) / rate
+                SLOT.pack_into(self._map, position * SLOT.size, key_hash, tokens, now)
+            finally:
+                if self._file is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+        return retry_after
+
+    def reset(self):
+        with self._lock:
+            if self._map is not None:
+                self._map[:] = bytes(len(self._map))
+
+
+limiter = TokenBucketLimiter(settings.RATE_LIMIT_FILE)
+
+
+def check_rate_limit(request, scope):
+    """Ответ 429 или None. Бакеты: пользователь и команда (комната чата)"""
+    limits = settings.RATE_LIMITS.get(scope, {})
+    keys = [('user', request.user.pk), ('room', request.user.team_id)]
+    for kind, value in keys:
+        limit = limits.get(kind)
+        if limit is None or value is None:
+            continue
+        rate, burst = limit
+        retry_after = limiter.consume(f'{scope}:{kind}:{value}', rate, burst)
+        if retry_after:
+            response = JsonResponse(
+                {'error': 'Too many requests', 'retry_after': round(retry_after, 3)}, status=429
+            )
+            response['Retry-After'] = str(math.ceil(retry_after))
+            return response
+    return None
+
+
+def rate_limit(scope):
+    """Декоратор view: ограничение RATE_LIMITS[scope]; ставить после login_required"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = check_rate_limit(request, scope)
+            if response is not None:
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
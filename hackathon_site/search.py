@@ -0,0 +1,167 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+POSTGRES_CONFIG = 'russian'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def encode_cursor(rank, object_id):
+    return f'{rank!r}:{object_id}'
+
+
+def decode_cursor(cursor):
+    """(rank, id) из курсора или None, если курсор испорчен"""
+    rank, _, object_id = (cursor or '').rpartition(':')
+    try:
+        return float(rank), int(object_id)
+    except ValueError:
+        return None
+
+
+class SearchIndex:
+    """Полнотекстовый индекс по текстовым полям одной таблицы.
+
+    SQLite: FTS5-таблица с внешним содержимым, её обновляют триггеры
+    при вставке, правке и удалении строк (в том числе bulk_create).
+    PostgreSQL: GIN-индекс по выражению to_tsvector, его поддерживает сама база.
+    На остальных базах поиск сводится к icontains.
+    """
+
+    def __init__(self, table, fields):
+        self.table = table
+        self.fields = fields
+        self.fts_table = f'{table}_fts'
+
+    # Установка
+
+    def _sqlite_triggers(self):
+        columns = ', '.join(self.fields)
+        new_values = ', '.join(f'new.{field}' for field in self.fields)
+        old_values = ', '.join(f'old.{field}' for field in self.fields)
+        delete = (
+            f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values});"
+        )
+        insert = f'INSERT INTO {self.fts_table}(rowid, {columns}) VALUES (new.id, {new_values});'
+        return {
+            f'{self.fts_table}_insert': f'AFTER INSERT ON {self.table} BEGIN {insert} END',
+            f'{self.fts_table}_delete': f'AFTER DELETE ON {self.table} BEGIN {delete} END',
+            f'{self.fts_table}_update': (
+                f'AFTER UPDATE OF {columns} ON {self.table} BEGIN {delete} {insert} END'
+            ),
+        }
+
+    def _postgres_vector(self, qualified=False):
+        prefix = f'"{self.table}".' if qualified else ''
+        columns = " || ' ' || ".join(f"coalesce({prefix}\"{field}\", '')" for field in self.fields)
+        return f"to_tsvector('{POSTGRES_CONFIG}', {columns})"
+
+    def install(self, connection, rebuild=False):
+        """Создаёт индекс, если его нет. Повторный вызов безопасен.
+
+        В SQLite пересоздание таблицы миграцией удаляет её триггеры,
+        поэтому install вызывается и после каждого migrate.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5("
+                    f"{', '.join(self.fields)}, content='{self.table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                )
+                for name, body in self._sqlite_triggers().items():
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+                    cursor.execute(f'CREATE TRIGGER {name} {body}')
+                if rebuild:
+                    cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('rebuild')")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {self.table}_search_idx '
+                    f'ON {self.table} USING gin (({self._postgres_vector()}))'
+                )
+
+    def restore_triggers(self, connection):
+        """Возвращает триггеры после migrate, если индекс уже установлен"""
+        if connection.vendor == 'sqlite' and self.fts_table in connection.introspection.table_names():
+            self.install(connection)
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                for name in self._sqlite_triggers():
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+                cursor.execute(f'DROP TABLE IF EXISTS {self.fts_table}')
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'DROP INDEX IF EXISTS {self.table}_search_idx')
+
+    # Поиск
+
+    def _match(self, vendor, query):
+        """(условие WHERE, параметры, выражение ранга, параметры ранга)"""
+        if vendor == 'sqlite':
+            # Слова в кавычках: спецсимволы FTS5 из запроса не ломают MATCH
+            match = ' '.join(f'"{word}"' for word in WORD_RE.findall(query))
+            return f'"{self.fts_table}" MATCH %s', [match], f'bm25("{self.fts_table}")', []
+        if vendor == 'postgresql':
+            vector = self._postgres_vector(qualified=True)
+            tsquery = f"websearch_to_tsquery('{POSTGRES_CONFIG}', %s)"
+            return f'{vector} @@ {tsquery}', [query], f'-ts_rank({vector}, {tsquery})', [query]
+        return None
+
+    def match_q(self, queryset, query):
+        """Q-условие "строка подходит под запрос" - для фильтров и админки"""
+        connection = connections[queryset.db]
+        if connection.vendor == 'sqlite':
+            if not WORD_RE.search(query):
+                return Q(pk__in=[])
+            where, params, _, _ = self._match('sqlite', query)
+            return Q(pk__in=RawSQL(f'SELECT rowid FROM "{self.fts_table}" WHERE {where}', params))
+        if connection.vendor == 'postgresql':
+            where, params, _, _ = self._match('postgresql', query)
+            return Q(pk__in=RawSQL(f'SELECT id FROM "{self.table}" WHERE {where}', params))
+        condition = Q()
+        for field in self.fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        return condition
+
+    def search(self, queryset, query, cursor=None, limit=20):
+        """Страница результатов по релевантности: (объекты, курсор следующей страницы).
+
+        У каждого объекта есть атрибут search_rank (меньше - релевантнее).
+        """
+        connection = connections[queryset.db]
+        if connection.vendor == 'sqlite' and not WORD_RE.search(query):
+            return [], None
+
+        match = self._match(connection.vendor, query)
+        if match is None:
+            queryset = queryset.filter(self.match_q(queryset, query)).extra(select={'search_rank': '0'})
+            rank_sql, rank_params = '0', []
+        else:
+            where, params, rank_sql, rank_params = match
+            tables = [self.fts_table] if connection.vendor == 'sqlite' else []
+            extra_where = [where]
+            if tables:
+                extra_where.insert(0, f'"{self.fts_table}".rowid = "{self.table}"."id"')
+            queryset = queryset.extra(
+                select={'search_rank': rank_sql}, select_params=rank_params,
+                tables=tables, where=extra_where, params=params,
+            )
+
+        position = decode_cursor(cursor) if cursor else None
+        if position is not None:
+            rank, last_id = position
+            queryset = queryset.extra(
+                where=[f'({rank_sql} > %s OR ({rank_sql} = %s AND "{self.table}"."id" < %s))'],
+                params=[*rank_params, rank, *rank_params, rank, last_id],
+            )
+
+        rows = list(queryset.order_by('search_rank', '-id')[:limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].search_rank, rows[-1].id)
@@ -3,6 +3,7 @@ Django settings for hackathon_site project.
 """
 
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -18,6 +19,7 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-7qp=l*d-=vg0_wdm5-exl
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 #DEBUG = True
+TESTING = sys.argv[1:2] == ['test']
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '').split(',') + ['localhost', '127.0.0.1']
 
 # Application definition
@@ -75,6 +77,18 @@ DATABASES = {
     )
 }
 
+# Cache: локальный по умолчанию; при нескольких процессах - общий Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -124,6 +138,76 @@ SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
 SESSION_SAVE_EVERY_REQUEST = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
+# Chat settings
+CHAT_LONG_POLL_MAX_WAIT = 25  # seconds
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+# Буфер последних сообщений в памяти процесса
+CHAT_BUFFER_MESSAGES_PER_ROOM = 200
+CHAT_BUFFER_MAX_BYTES = 32 * 1024 * 1024
+CHAT_BUFFER_MAX_STALENESS = 1.0  # seconds, как часто догружать сообщения из других процессов
+CHAT_FRAGMENT_CACHE_SIZE = 50000  # закодированных в JSON сообщений
+# Групповая запись сообщений: одновременные отправки пишутся одним bulk_create.
+# Собирает запросы, которые процесс обслуживает параллельно: под ASGI каждый
+# запрос получает свой поток для синхронных view, под WSGI - потоки gunicorn
+CHAT_BATCH_WRITES = os.environ.get('CHAT_BATCH_WRITES', 'False') == 'True'
+CHAT_BATCH_WINDOW = 0.005  # seconds
+CHAT_BATCH_MAX_SIZE = 100
+CHAT_BATCH_FOLLOWER_TIMEOUT = 10  # seconds, дольше ждать записи чужой пачки не будем
+# Token bucket для API чата: (токенов в секунду, ёмкость) на пользователя и на команду.
+# None - без ограничения. Превышение - 429 с заголовком Retry-After
+RATE_LIMITS = {
+    'send': {'user': (1, 20), 'room': (10, 100)},
+    'poll': {'user': (5, 60), 'room': (50, 500)},
+}
+# Файл таблицы бакетов, общей для процессов хоста; без файла - память процесса
+RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE')
+RATE_LIMIT_SLOTS = 65536
+# Рассылка событий чата между процессами одного хоста (несколько воркеров gunicorn).
+# chat.bus.InMemoryEventBus - один процесс, chat.bus.UnixSocketEventBus - несколько
+CHAT_EVENT_BUS = os.environ.get('CHAT_EVENT_BUS', 'chat.bus.InMemoryEventBus')
+CHAT_EVENT_BUS_DIR = os.environ.get('CHAT_EVENT_BUS_DIR', '/tmp/hackathon-chat-bus')
+CHAT_EVENT_BUS_MAX_LATENCY = 2.0  # seconds, более поздние события получатель отбрасывает
+CHAT_EVENT_BUS_MAX_BODY = 60 * 1024  # bytes, длинные сообщения получатель читает из базы
+CHAT_EVENT_BUS_QUEUE_SIZE = 1000  # событий в очереди процесса (InMemoryEventBus)
+CHAT_SUBSCRIBER_QUEUE_SIZE = 100  # событий в очереди одного WebSocket-клиента
+# Курсоры прочтения от отправок пишутся пачками не реже раза в интервал.
+# 0 - сразу, без пачки и таймера: так в тестах, где поток таймера
+# пережил бы транзакцию теста
+CHAT_READ_CURSOR_FLUSH_INTERVAL = float(
+    os.environ.get('CHAT_READ_CURSOR_FLUSH_INTERVAL', 0 if TESTING else 2.0)
+)  # seconds
+CHAT_READ_CURSOR_BATCH_SIZE = 200
+CHAT_UNREAD_MAX = 100
+SEARCH_PAGE_SIZE = 20
+CHAT_ATTACHMENT_MAX_SIZE = 200 * 1024 * 1024  # bytes
+# Холодный архив старой истории чатов (manage.py archive_chat_history)
+CHAT_ARCHIVE_ROOT = BASE_DIR / 'chat_archive'
+CHAT_ARCHIVE_SEGMENT_SIZE = 64 * 1024 * 1024  # bytes
+CHAT_ARCHIVE_BLOCK_MESSAGES = 256
+# Подбор участников и команд по навыкам (accounts.matching)
+MATCHING_MAX_AGE = 60  # seconds, другие процессы увидят изменения не позже
+MATCHING_RECOMMENDATIONS = 5
+TEAM_BULK_INVITATIONS_MAX = 500  # заявок в одном запросе InvitationBulkView
+ROSTER_HASH_WORKERS = 2  # процессов хеширования паролей при импорте ростера из админки
+# Снимки команд для страницы команды и чата (teams.snapshot)
+TEAM_SNAPSHOT_CACHE_SIZE = 2000
+TEAM_SNAPSHOT_MAX_AGE = 30  # seconds, другие процессы увидят изменения не позже
+# Счётчики главной страницы (news.stats), сбрасываются сигналами
+SITE_STATS_CACHE = 'default'
+SITE_STATS_LOCK_TIMEOUT = 5  # seconds, дольше ждать чужого подсчёта не будем
+SITE_STATS_MAX_AGE = 30  # seconds, другие процессы без общего кэша увидят изменения не позже
+# Страницы новостей и расписания для анонимов (news.pagecache)
+PAGE_CACHE = 'default'
+PAGE_CACHE_TIMEOUT = 600  # seconds, правки автора новости видны не позже
+# Уменьшенные копии изображений (hackathon_site.images), ширины в пикселях
+IMAGE_VARIANT_WIDTHS = {
+    'news.News.image': (320, 640, 960, 1280),
+    'accounts.Profile.avatar': (64, 128, 256),
+}
+IMAGE_VARIANTS_WORKERS = 2
+IMAGE_VARIANTS_MISSING_TTL = 60  # seconds, отсутствие вариантов перепроверяется не чаще
+
 # Custom error pages
 handler404 = 'news.views.custom_404'
 handler403 = 'news.views.custom_403'
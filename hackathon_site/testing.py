@@ -0,0 +1,78 @@
+"""
+Общие помощники для тестов.
+"""
+
+import warnings
+from http.cookies import SimpleCookie
+
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+
+# Так Django 4.2 предупреждает, что прочитал ответ в память целиком
+SYNC_ITERATOR_WARNING = 'StreamingHttpResponse must consume synchronous iterators'
+
+
+class QueryPlanAssertionsMixin:
+    """Проверка плана запроса: горячие запросы должны идти по индексу.
+
+    На SQLite разбирается EXPLAIN QUERY PLAN, на PostgreSQL план строится
+    с enable_seqscan = off: если подходящего индекса нет, планировщик всё
+    равно выберет Seq Scan, и тест упадёт.
+    """
+
+    def assertUsesIndex(self, queryset, table=None, ordered=False):
+        table = table or queryset.model._meta.db_table
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # TestCase держит тест в транзакции, SET LOCAL откатится вместе с ней
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotRegex(plan, rf'Seq Scan on {table}\b', msg=plan)
+            if ordered:
+                self.assertNotRegex(plan, r'\bSort\b', msg=plan)
+            return plan
+
+        if connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertNotRegex(plan, rf'\bSCAN {table}\b', msg=plan)
+            self.assertRegex(plan, rf'\bSEARCH {table} USING (COVERING )?INDEX\b', msg=plan)
+            if ordered:
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, msg=plan)
+            return plan
+
+        self.skipTest(f'Нет проверки плана для {connection.vendor}')
+
+
+async def asgi_get(path, cookies=None, headers=(), query_string=b''):
+    """GET через ASGIHandler Django, как под uvicorn из Procfile.
+
+    Возвращает (статус, заголовки, [куски тела], буферизован ли ответ).
+    View выполняются в потоках ASGIHandler, поэтому тестам нужны
+    закоммиченные данные (TransactionTestCase).
+    """
+    cookie_header = '; '.join(f'{key}={morsel.value}' for key, morsel in (cookies or SimpleCookie()).items())
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query_string, 'root_path': '',
+        'headers': [(b'cookie', cookie_header.encode())] + [
+            (name.lower().encode(), value.encode()) for name, value in headers
+        ],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        await ASGIHandler()(scope, receive, send)
+    start = messages[0]
+    chunks = [message['body'] for message in messages[1:] if message.get('body')]
+    buffered = any(SYNC_ITERATOR_WARNING in str(warning.message) for warning in caught)
+    return start['status'], dict(start['headers']), chunks, buffered
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import News, Schedule, Task
+from django.db.models import Q
+from .models import News, Schedule, Task, news_search
 
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
@@ -8,6 +9,15 @@ class NewsAdmin(admin.ModelAdmin):
     search_fields = ('title', 'content', 'author__username')
     readonly_fields = ('created_at', 'updated_at')
     date_hierarchy = 'created_at'
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Заголовок и текст ищем по полнотекстовому индексу вместо icontains
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            news_search.match_q(queryset, search_term) | Q(author__username__iexact=search_term)
+        ), False
 
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from hackathon_site.images import generate_variants, image_variants, variants_ready
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие уменьшенные копии и WebP для уже загруженных '
+        'изображений (IMAGE_VARIANT_WIDTHS). Новые загрузки обрабатываются сами.'
+    )
+
+    def handle(self, *args, **options):
+        for label, widths in image_variants.widths.items():
+            model_label, field = label.rsplit('.', 1)
+            model = apps.get_model(model_label)
+            names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            created = 0
+            for name in names.values_list(field, flat=True).iterator():
+                try:
+                    variants = generate_variants(name, widths)
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                if variants:
+                    created += len(variants)
+                    variants_ready.send(sender=model, name=name)
+            self.stdout.write(f'{label}: создано вариантов {created}')
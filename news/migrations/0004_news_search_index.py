@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from hackathon_site.search import SearchIndex
+
+index = SearchIndex('news_news', ['title', 'content'])
+
+
+def install_index(apps, schema_editor):
+    index.install(schema_editor.connection, rebuild=True)
+
+
+def uninstall_index(apps, schema_editor):
+    index.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_task_news_task_team_assignee_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, uninstall_index),
+    ]
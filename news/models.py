@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 
+from hackathon_site.search import SearchIndex
+
 class News(models.Model):
     id = models.BigAutoField(primary_key=True)
     title = models.CharField(max_length=200)
@@ -17,6 +19,9 @@ class News(models.Model):
     def __str__(self):
         return self.title
 
+# Полнотекстовый индекс по заголовку и тексту новостей (миграция 0004)
+news_search = SearchIndex(News._meta.db_table, ['title', 'content'])
+
 class Schedule(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -25,6 +30,7 @@ class Schedule(models.Model):
     location = models.CharField(max_length=200, blank=True)
     is_important = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['start_time']
@@ -57,6 +63,10 @@ class Task(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Задачи команды и её участников
+            models.Index(fields=['team', 'assigned_to'], name='news_task_team_assignee_idx'),
+        ]
     
     def __str__(self):
         return self.title
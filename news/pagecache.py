@@ -0,0 +1,119 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+# Области кэша: сигналы сбрасывают страницы своей модели целиком
+NEWS = 'news'
+SCHEDULE = 'schedule'
+
+
+class PageCache:
+    """Готовые страницы для анонимных посетителей, по адресу и номеру страницы.
+
+    Кэшируются только GET без сессии и cookie сообщений: у такого
+    посетителя нет сообщений и CSRF-токена, страница у всех одинаковая.
+    Запись помечена версией своей области (как в SiteStats): версия
+    читается до рендера, сигналы меняют её после коммита, так что
+    отрисованная до изменения страница не отдаётся. ETag - хеш содержимого,
+    Last-Modified - от updated_at показанных записей; повторный запрос
+    с совпавшим валидатором получает 304.
+    """
+
+    def __init__(self, cache_alias, timeout):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _version(self, scope):
+        key = f'page_cache:{scope}:version'
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def applies(self, request):
+        return (
+            request.method == 'GET'
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES
+            and not request.user.is_authenticated
+            # Поиск и прочие параметры не кэшируем - ключей было бы без счёта
+            and set(request.GET) <= {'page'}
+        )
+
+    def key(self, scope, request):
+        page = f'{request.path}?page={request.GET.get("page", "")}'
+        return f'page_cache:{scope}:{hashlib.md5(page.encode()).hexdigest()}'
+
+    def get(self, scope, request):
+        """(запись или None, текущая версия области)"""
+        version = self._version(scope)
+        entry = self.cache.get(self.key(scope, request))
+        if entry is not None and entry['version'] == version:
+            return entry, version
+        return None, version
+
+    def store(self, scope, request, version, response, last_modified=None):
+        entry = {
+            'version': version,
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': f'"{hashlib.md5(response.content).hexdigest()}"',
+            'last_modified': int(last_modified.timestamp()) if last_modified else None,
+        }
+        self.cache.set(self.key(scope, request), entry, timeout=self.timeout)
+        return entry
+
+    def respond(self, request, entry):
+        """Страница из записи или 304, если валидаторы клиента совпали"""
+        response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+        if response is None:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response.headers['ETag'] = entry['etag']
+        if entry['last_modified'] is not None:
+            response.headers['Last-Modified'] = http_date(entry['last_modified'])
+        # Браузер хранит страницу, но каждый раз сверяет валидаторы
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def invalidate(self, scope):
+        self.cache.set(f'page_cache:{scope}:version', uuid.uuid4().hex, timeout=None)
+
+
+page_cache = PageCache(cache_alias=settings.PAGE_CACHE, timeout=settings.PAGE_CACHE_TIMEOUT)
+
+
+class AnonymousPageCacheMixin:
+    """Отдаёт анонимам страницу из page_cache; last_modified() - для Last-Modified"""
+
+    page_cache_scope = None
+
+    def last_modified(self):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not page_cache.applies(request):
+            return super().dispatch(request, *args, **kwargs)
+        entry, version = page_cache.get(self.page_cache_scope, request)
+        if entry is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if hasattr(response, 'render'):
+                response.render()
+            # Страница выдала cookie или CSRF-токен - она не общая
+            if response.cookies or request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                return response
+            entry = page_cache.store(self.page_cache_scope, request, version, response, self.last_modified())
+        return page_cache.respond(request, entry)
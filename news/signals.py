@@ -0,0 +1,56 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from hackathon_site.images import image_variants, variants_ready
+from teams.models import Team
+from .models import News, Schedule, news_search
+from .pagecache import NEWS, SCHEDULE, page_cache
+from .stats import site_stats
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    # Пересоздание таблицы в миграциях SQLite удаляет триггеры полнотекстового индекса
+    news_search.restore_triggers(connections[using])
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def stats_changed(sender, update_fields=None, **kwargs):
+    # Вход обновляет только last_login - на счётчики не влияет
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Сразу и после коммита: значение, посчитанное до коммита, не останется в кэше
+    site_stats.invalidate()
+    transaction.on_commit(site_stats.invalidate)
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def news_pages_changed(sender, **kwargs):
+    # Создание и правка через NewsCreateView/NewsUpdateView и админку
+    page_cache.invalidate(NEWS)
+    transaction.on_commit(lambda: page_cache.invalidate(NEWS))
+
+
+@receiver(post_save, sender=News)
+def news_image_saved(sender, instance, **kwargs):
+    image_variants.schedule_on_commit(instance.image)
+
+
+@receiver(variants_ready, sender=News)
+def news_image_variants_ready(sender, **kwargs):
+    # Страницы, отрисованные с оригиналом, перерисуются уже с srcset
+    page_cache.invalidate(NEWS)
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def schedule_pages_changed(sender, **kwargs):
+    page_cache.invalidate(SCHEDULE)
+    transaction.on_commit(lambda: page_cache.invalidate(SCHEDULE))
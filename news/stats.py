@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from accounts.models import User
+from teams.models import Team
+from .models import News
+
+
+class SiteStats:
+    """Счётчики главной страницы: активные команды, участники, новости.
+
+    Значение в кэше помечено версией, которую сигналы меняют после коммита
+    изменений команд, пользователей и новостей. Версия читается до подсчёта,
+    поэтому посчитанное до коммита значение получит старую версию и не будет
+    отдано после смены: счётчики точные, пока кэш общий для процессов.
+    С кэшем в памяти процесса (без REDIS_URL) сигнал другого процесса
+    сюда не дойдёт, поэтому значение живёт не дольше max_age секунд.
+    Одновременные промахи считают один раз: в процессе - под блокировкой,
+    между процессами - кто первым взял ключ блокировки в кэше, остальные
+    ждут его результат до lock_timeout секунд.
+    """
+
+    KEY = 'site_stats'
+    VERSION_KEY = 'site_stats:version'
+    LOCK_KEY = 'site_stats:lock'
+
+    def __init__(self, cache_alias, lock_timeout, max_age):
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.computed = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _version(self):
+        version = self.cache.get(self.VERSION_KEY)
+        if version is None:
+            # Версия вытеснена из кэша - сохранённые значения больше не совпадут
+            self.cache.add(self.VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(self.VERSION_KEY)
+        return version
+
+    def _cached(self, version):
+        stats = self.cache.get(self.KEY)
+        if stats is not None and stats['version'] == version:
+            return stats
+        return None
+
+    def get(self):
+        """{'teams_count', 'users_count', 'news_count'} из кэша или посчитанные"""
+        version = self._version()
+        stats = self._cached(version)
+        if stats is None:
+            with self._lock:
+                stats = self._cached(version) or self._compute_once(version)
+        return {key: value for key, value in stats.items() if key != 'version'}
+
+    def _compute_once(self, version):
+        if not self.cache.add(self.LOCK_KEY, version, timeout=self.lock_timeout):
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                stats = self._cached(version)
+                if stats is not None:
+                    return stats
+                if self.cache.get(self.LOCK_KEY) is None:
+                    break
+        try:
+            stats = {'version': version, **self.count()}
+            self.cache.set(self.KEY, stats, timeout=self.max_age)
+        finally:
+            self.cache.delete(self.LOCK_KEY)
+        return stats
+
+    def count(self):
+        self.computed += 1
+        return {
+            'teams_count': Team.objects.filter(is_active=True).count(),
+            'users_count': User.objects.filter(role='participant').count(),
+            'news_count': News.objects.filter(is_published=True).count(),
+        }
+
+    def invalidate(self):
+        self.cache.set(self.VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+site_stats = SiteStats(
+    cache_alias=settings.SITE_STATS_CACHE,
+    lock_timeout=settings.SITE_STATS_LOCK_TIMEOUT,
+    max_age=settings.SITE_STATS_MAX_AGE,
+)
@@ -0,0 +1,28 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from hackathon_site.images import image_variants
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(f'{url} {width}w' for url, width in variants)
+
+
+@register.simple_tag
+def responsive_image(fieldfile, sizes='100vw', **attrs):
+    """<img> с srcset из уменьшенных копий и WebP; пока их нет - оригинал.
+
+    {% responsive_image news.image sizes="(min-width: 992px) 640px, 100vw" class="card-img-top" alt=news.title %}
+    """
+    variants = image_variants.variants(fieldfile)
+    if variants is None:
+        return format_html('<img src="{}"{}>', fieldfile.url, flatatt(attrs))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        _srcset(variants['webp']), sizes,
+        fieldfile.url, _srcset(variants['fallback']), sizes, flatatt(attrs),
+    )
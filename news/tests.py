@@ -1,3 +1,271 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from accounts.models import Profile, User
+from hackathon_site.images import generate_variants, image_variants, variants_ready
+from hackathon_site.testing import QueryPlanAssertionsMixin
+from teams.models import Team
+from .models import News, Schedule, Task
+from .stats import site_stats
+
+
+class TaskQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    def test_team_member_tasks(self):
+        self.assertUsesIndex(Task.objects.filter(team_id=1, assigned_to_id=2))
+
+
+class NewsSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('admin', password='pass', role='admin')
+        News.objects.create(title='Итоги первого дня', content='Команды показали прототипы', author=cls.author)
+        News.objects.create(title='Расписание', content='Итоги подведём вечером', author=cls.author)
+        News.objects.create(title='Итоги', content='Черновик', author=cls.author, is_published=False)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_search_published_news_ranked(self):
+        response = self.client.get(reverse('news:list'), {'q': 'итоги'})
+
+        titles = [news.title for news in response.context['news_list']]
+        self.assertEqual(len(titles), 2)
+        self.assertNotIn('Черновик', response.content.decode())
+        self.assertIsNone(response.context['next_cursor'])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SiteStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('admin', password='pass', role='admin')
+        cls.participant = User.objects.create_user('user', password='pass')
+        Team.objects.create(name='Alpha', leader=cls.participant)
+        News.objects.create(title='Старт', content='Начинаем', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def home_stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('news:home'))
+        stats = {key: response.context[key] for key in ('teams_count', 'users_count', 'news_count')}
+        return stats, [q['sql'] for q in queries if 'COUNT' in q['sql']]
+
+    def test_home_serves_cached_counts_and_stays_exact(self):
+        stats, counts = self.home_stats()
+        self.assertEqual(stats, {'teams_count': 1, 'users_count': 1, 'news_count': 1})
+        self.assertEqual(len(counts), 3)
+        self.assertEqual(self.home_stats(), (stats, []))
+
+        self.client.force_login(self.participant)
+        self.assertEqual(self.home_stats(), (stats, []))
+
+        News.objects.create(title='Итоги', content='...', author=self.author)
+        User.objects.create_user('second', password='pass')
+        Team.objects.filter(name='Alpha').get().delete()
+        self.assertEqual(self.home_stats()[0], {'teams_count': 0, 'users_count': 2, 'news_count': 2})
+
+    def test_value_counted_before_invalidation_is_not_served(self):
+        version = site_stats._version()
+        site_stats.invalidate()
+        site_stats.cache.set(site_stats.KEY, {'version': version, 'teams_count': 99, 'users_count': 0, 'news_count': 0})
+        self.assertEqual(site_stats.get()['teams_count'], 1)
+
+    def test_concurrent_misses_count_once(self):
+        def slow_count():
+            time.sleep(0.2)
+            return {'teams_count': 1, 'users_count': 1, 'news_count': 1}
+
+        barrier = threading.Barrier(10)
+        results = []
+
+        def read():
+            barrier.wait()
+            results.append(site_stats.get())
+
+        with mock.patch.object(site_stats, 'count', side_effect=slow_count) as count:
+            threads = [threading.Thread(target=read) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(count.call_count, 1)
+        self.assertEqual(len(results), 10)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pass', role='admin')
+        cls.news = News.objects.create(title='Старт', content='Начинаем', author=cls.admin)
+        Schedule.objects.create(
+            title='Открытие', description='Сбор участников',
+            start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = Client()
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anonymous.get(url, **headers)
+        return response, len(queries)
+
+    def test_anonymous_pages_served_from_cache_with_304(self):
+        for url in (reverse('news:list'), reverse('news:detail', args=[self.news.pk]), reverse('news:schedule')):
+            first, queries = self.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(queries)
+            self.assertIn('Last-Modified', first)
+
+            second, queries = self.get(url)
+            self.assertEqual((second.content, second['ETag'], queries), (first.content, first['ETag'], 0))
+
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=first['ETag'])[0].status_code, 304)
+            self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])[0].status_code, 304)
+
+    def test_pages_keyed_by_page_number(self):
+        for number in range(12):
+            News.objects.create(title=f'Новость {number}', content='...', author=self.admin)
+        first = self.anonymous.get(reverse('news:list'))
+        second = self.anonymous.get(reverse('news:list'), {'page': 2})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(len(second.context['news_list']), 3)
+
+    def test_admin_edit_purges_pages(self):
+        url = reverse('news:detail', args=[self.news.pk])
+        etag = self.anonymous.get(url)['ETag']
+        list_etag = self.anonymous.get(reverse('news:list'))['ETag']
+
+        self.client.force_login(self.admin)
+        self.assertNotIn('ETag', self.client.get(url))
+        response = self.client.post(
+            reverse('news:edit', args=[self.news.pk]),
+            {'title': 'Старт перенесён', 'content': 'Начинаем позже', 'is_published': 'on'},
+        )
+        self.assertRedirects(response, reverse('news:list'), fetch_redirect_response=False)
+
+        response = self.anonymous.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Старт перенесён')
+        self.assertContains(self.anonymous.get(reverse('news:list'), HTTP_IF_NONE_MATCH=list_etag), 'Старт перенесён')
+
+        self.client.post(reverse('news:create'), {'title': 'Итоги', 'content': '...', 'is_published': 'on'})
+        self.assertContains(self.anonymous.get(reverse('news:list')), 'Итоги')
+
+    def test_page_rendered_before_invalidation_is_not_served(self):
+        url = reverse('news:schedule')
+        response = self.anonymous.get(url)
+        Schedule.objects.create(
+            title='Защита', description='Финал', start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=2),
+        )
+        response = self.anonymous.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'Защита')
+
+
+def image_upload(name, size, format='JPEG', mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{format.lower()}')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ImageVariantsTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        image_variants.clear()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+
+    def test_page_uses_original_until_variants_ready(self):
+        news = News.objects.create(
+            title='Старт', content='Начинаем', author=self.admin, image=image_upload('photo.jpg', (2000, 1000)),
+        )
+        url = reverse('news:detail', args=[news.pk])
+        response = Client().get(url)
+        self.assertContains(response, f'src="{news.image.url}"')
+        self.assertNotContains(response, 'srcset')
+
+        widths = image_variants.widths_for(news.image)
+        variants = generate_variants(news.image.name, widths)
+        self.assertEqual(len(variants), 2 * len(widths))
+        self.assertEqual(generate_variants(news.image.name, widths), [])
+        with default_storage.open(variants[0]) as variant:
+            self.assertEqual(Image.open(variant).size, (320, 160))
+        variants_ready.send(sender=News, name=news.image.name)
+
+        response = Client().get(url)
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, news.image.url.replace('.jpg', '.640w.webp') + ' 640w')
+        self.assertContains(response, news.image.url.replace('.jpg', '.1280w.jpg') + ' 1280w')
+
+    def test_missing_variants_are_not_rechecked_on_every_render(self):
+        news = News.objects.create(
+            title='Старт', content='Начинаем', author=self.admin, image=image_upload('photo.jpg', (800, 600)),
+        )
+        with mock.patch.object(default_storage, 'exists', return_value=False) as exists:
+            self.assertIsNone(image_variants.variants(news.image))
+            self.assertIsNone(image_variants.variants(news.image))
+        self.assertEqual(exists.call_count, 1)
+
+        call_command('generate_image_variants', stdout=io.StringIO())
+        self.assertIsNotNone(image_variants.variants(news.image))
+
+    def test_cancelled_generation_is_not_an_error(self):
+        future = Future()
+        future.cancel()
+        image_variants._pending['news/photo.jpg'] = (future, News)
+        with mock.patch.object(variants_ready, 'send') as send:
+            image_variants._done('news/photo.jpg')
+        send.assert_not_called()
+        self.assertEqual(image_variants._pending, {})
+        self.assertNotIn('news/photo.jpg', image_variants._ready)
+
+    def test_upload_schedules_generation_after_commit(self):
+        self.client.force_login(self.admin)
+        with mock.patch.object(image_variants, 'schedule') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('news:create'), {
+                    'title': 'Фото', 'content': '...', 'is_published': 'on',
+                    'image': image_upload('photo.jpg', (800, 600)),
+                })
+            news = News.objects.get(title='Фото')
+            self.assertEqual([call.args[0].name for call in schedule.call_args_list], [news.image.name])
+
+            schedule.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                News.objects.create(title='Без фото', content='...', author=self.admin)
+            schedule.assert_not_called()
+
+    def test_avatar_keeps_transparency_and_is_not_upscaled(self):
+        profile = Profile.objects.create(user=self.admin, avatar=image_upload('me.png', (100, 100), 'PNG', 'RGBA'))
+        variants = generate_variants(profile.avatar.name, image_variants.widths_for(profile.avatar))
+        self.assertTrue(all(name.endswith(('.png', '.webp')) for name in variants))
+        with default_storage.open(variants[-2]) as variant:
+            image = Image.open(variant)
+            self.assertEqual((image.size, image.mode), ((100, 100), 'RGBA'))
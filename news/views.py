@@ -7,7 +7,9 @@ from django.utils import timezone
 from django.urls import reverse_lazy
 from django.http import HttpResponseForbidden
 from django.db import models
-from .models import News, Schedule, Task
+from .models import News, Schedule, Task, news_search
+from .pagecache import NEWS, SCHEDULE, AnonymousPageCacheMixin
+from .stats import site_stats
 from .forms import NewsForm, ScheduleForm, TaskForm
 
 def is_admin(user):
@@ -22,33 +24,66 @@ class HomeView(ListView):
     def get_queryset(self):
         return News.objects.filter(is_published=True).select_related('author')
     
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        # Та же выборка, что и news_count: пагинатору не нужен свой COUNT.
+        # Без общего кэша число может отставать не дольше SITE_STATS_MAX_AGE
+        paginator.count = self.stats['news_count']
+        return paginator
+    
+    def get(self, request, *args, **kwargs):
+        self.stats = site_stats.get()
+        return super().get(request, *args, **kwargs)
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Добавляем статистику
-        from django.db.models import Count
-        from teams.models import Team
-        from accounts.models import User
-        
-        context['teams_count'] = Team.objects.filter(is_active=True).count()
-        context['users_count'] = User.objects.filter(role='participant').count()
-        context['news_count'] = News.objects.filter(is_published=True).count()
+        # Статистика из кэша, сигналы сбрасывают его при изменениях
+        context.update(self.stats)
         
         return context
 
-class NewsListView(ListView):
+class NewsListView(AnonymousPageCacheMixin, ListView):
     model = News
     template_name = 'news/news_list.html'
     context_object_name = 'news_list'
     paginate_by = 10
+    page_cache_scope = NEWS
+    
+    def last_modified(self):
+        return News.objects.filter(is_published=True).aggregate(last=models.Max('updated_at'))['last']
+    
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+    
+    def get_paginate_by(self, queryset):
+        # Результаты поиска листаются курсором, а не номерами страниц
+        return None if self.get_search_query() else self.paginate_by
     
     def get_queryset(self):
-        return News.objects.filter(is_published=True).select_related('author')
+        queryset = News.objects.filter(is_published=True).select_related('author')
+        query = self.get_search_query()
+        if not query:
+            return queryset
+        results, self.next_cursor = news_search.search(
+            queryset, query, cursor=self.request.GET.get('cursor'), limit=self.paginate_by
+        )
+        return results
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search_query'] = self.get_search_query()
+        context['next_cursor'] = getattr(self, 'next_cursor', None)
+        return context
 
-class NewsDetailView(DetailView):
+class NewsDetailView(AnonymousPageCacheMixin, DetailView):
     model = News
     template_name = 'news/news_detail.html'
     context_object_name = 'news'
+    page_cache_scope = NEWS
+    
+    def last_modified(self):
+        return self.object.updated_at
 
 class NewsCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     model = News
@@ -72,10 +107,14 @@ class NewsUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def test_func(self):
         return self.request.user.role == 'admin'
 
-class ScheduleListView(ListView):
+class ScheduleListView(AnonymousPageCacheMixin, ListView):
     model = Schedule
     template_name = 'news/schedule.html'
     context_object_name = 'events'
+    page_cache_scope = SCHEDULE
+    
+    def last_modified(self):
+        return Schedule.objects.aggregate(last=models.Max('updated_at'))['last']
     
     def get_queryset(self):
         return Schedule.objects.all().order_by('start_time')
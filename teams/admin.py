@@ -1,20 +1,44 @@
 from django.contrib import admin
+
+from .invitations import process_invitations, summarize
 from .models import Team, TeamInvitation
 
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
-    list_display = ('name', 'leader', 'member_count', 'max_members', 'is_active', 'created_at')
+    list_display = ('name', 'leader', 'member_count', 'max_members', 'has_open_slots', 'is_active', 'created_at')
     list_filter = ('is_active', 'created_at')
+    list_select_related = ('leader',)
     search_fields = ('name', 'leader__username', 'leader__email')
     readonly_fields = ('created_at', 'member_count')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_open_slots()
+    
+    @admin.display(description='Количество участников', ordering='member_count')
     def member_count(self, obj):
-        return obj.member_count()
-    member_count.short_description = 'Количество участников'
+        return obj.member_count
+    
+    @admin.display(boolean=True, description='Есть места', ordering='has_open_slots')
+    def has_open_slots(self, obj):
+        return obj.has_open_slots
 
 @admin.register(TeamInvitation)
 class TeamInvitationAdmin(admin.ModelAdmin):
     list_display = ('team', 'invited_user', 'invited_by', 'is_accepted', 'created_at')
     list_filter = ('is_accepted', 'created_at')
+    list_select_related = ('team', 'invited_user', 'invited_by')
     search_fields = ('team__name', 'invited_user__username', 'invited_by__username')
     readonly_fields = ('created_at',)
+    actions = ('accept_invitations', 'decline_invitations')
+    
+    def process(self, request, queryset, accept):
+        outcomes = process_invitations(list(queryset.values_list('id', flat=True)), accept=accept)
+        self.message_user(request, summarize(outcomes))
+    
+    @admin.action(description='Принять выбранные заявки')
+    def accept_invitations(self, request, queryset):
+        self.process(request, queryset, accept=True)
+    
+    @admin.action(description='Отклонить выбранные заявки')
+    def decline_invitations(self, request, queryset):
+        self.process(request, queryset, accept=False)
@@ -5,3 +5,6 @@ class TeamsConfig(AppConfig):
     default_auto_field = 'id'
     name = 'teams'
     verbose_name = _('Teams')
+    
+    def ready(self):
+        from . import signals  # noqa: F401
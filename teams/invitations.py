@@ -0,0 +1,106 @@
+from collections import Counter
+
+from django.db import transaction
+
+from accounts.matching import skill_matcher
+from accounts.models import User
+from .models import Team, TeamInvitation
+from .snapshot import team_snapshots
+
+ACCEPTED = 'accepted'
+DECLINED = 'declined'
+TEAM_FULL = 'team_full'
+USER_TAKEN = 'user_taken'
+ALREADY_PROCESSED = 'already_processed'
+FORBIDDEN = 'forbidden'
+NOT_FOUND = 'not_found'
+
+OUTCOME_LABELS = {
+    ACCEPTED: 'принято',
+    DECLINED: 'отклонено',
+    TEAM_FULL: 'команда заполнена',
+    USER_TAKEN: 'участник уже в другой команде',
+    ALREADY_PROCESSED: 'уже обработано',
+    FORBIDDEN: 'нет прав',
+    NOT_FOUND: 'не найдено',
+}
+
+
+def summarize(outcomes):
+    """Сводка для сообщения: 'Принято: 3, Команда заполнена: 1'.
+
+    Исходы идут в порядке OUTCOME_LABELS, а не в порядке id заявок.
+    """
+    counts = Counter(outcomes.values())
+    return ', '.join(
+        f'{label.capitalize()}: {counts[outcome]}' for outcome, label in OUTCOME_LABELS.items() if counts[outcome]
+    )
+
+
+def process_invitations(invitation_ids, accept, leader=None):
+    """Принимает или отклоняет заявки пачкой, возвращает {id заявки: исход}.
+
+    Всё в одной транзакции и в том же порядке блокировок, что
+    accept_invitation: заявки, затем команды в порядке id, затем участники.
+    Места проверяются один раз на команду - принимаются самые ранние
+    заявки, пока есть места, - изменения пишутся UPDATE по списку id
+    и bulk_update. leader - обрабатывать только заявки его команд
+    (None - организатор, без ограничений).
+    """
+    outcomes = {invitation_id: NOT_FOUND for invitation_id in invitation_ids}
+    with transaction.atomic():
+        invitations = list(
+            TeamInvitation.objects.select_for_update(of=('self',)).select_related('team', 'invited_user')
+            .filter(id__in=outcomes).order_by('id')
+        )
+        pending = []
+        for invitation in invitations:
+            if leader is not None and invitation.team.leader_id != leader.id:
+                outcomes[invitation.id] = FORBIDDEN
+            elif invitation.is_accepted is not None:
+                outcomes[invitation.id] = ALREADY_PROCESSED
+            else:
+                pending.append(invitation)
+
+        team_snapshots.invalidate_on_commit(*{invitation.team_id for invitation in pending})
+        if not accept:
+            TeamInvitation.objects.filter(id__in=[invitation.id for invitation in pending]).update(is_accepted=False)
+            outcomes.update((invitation.id, DECLINED) for invitation in pending)
+            return outcomes
+
+        team_ids = {invitation.team_id for invitation in pending}
+        team_ids |= {invitation.invited_user.team_id for invitation in pending} - {None}
+        teams = Team.objects.select_for_update().order_by('id').in_bulk(team_ids)
+        users = User.objects.select_for_update().only('id', 'team_id').in_bulk(
+            {invitation.invited_user_id for invitation in pending}
+        )
+
+        accepted, joined_users, moved_users = [], set(), []
+        for invitation in pending:
+            user = users[invitation.invited_user_id]
+            team = teams[invitation.team_id]
+            # Участник уже принят этой пачкой или перешёл в другую команду, пока мы читали заявки
+            if user.id in joined_users or user.team_id != invitation.invited_user.team_id:
+                outcomes[invitation.id] = USER_TAKEN
+                continue
+            if user.team_id != team.id:
+                if team.is_full():
+                    outcomes[invitation.id] = TEAM_FULL
+                    continue
+                team.member_count += 1
+                if user.team_id:
+                    old_team = teams[user.team_id]
+                    old_team.member_count = max(old_team.member_count - 1, 0)
+                user.team_id = team.id
+                moved_users.append(user)
+            joined_users.add(user.id)
+            accepted.append(invitation.id)
+            outcomes[invitation.id] = ACCEPTED
+
+        TeamInvitation.objects.filter(id__in=accepted).update(is_accepted=True)
+        User.objects.bulk_update(moved_users, ['team'], batch_size=500)
+        Team.objects.bulk_update(teams.values(), ['member_count'], batch_size=500)
+        if moved_users:
+            team_snapshots.invalidate_on_commit(*teams)
+            transaction.on_commit(skill_matcher.invalidate)
+    return outcomes
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0003_message'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['team', 'id'], name='teams_msg_team_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teaminvitation',
+            index=models.Index(fields=['team', 'is_accepted'], name='teams_invite_team_status_idx'),
+        ),
+    ]
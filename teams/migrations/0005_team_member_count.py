@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_member_count(apps, schema_editor):
+    Team = apps.get_model('teams', 'Team')
+    User = apps.get_model('accounts', 'User')
+    Team.objects.update(member_count=Coalesce(Subquery(
+        User.objects.filter(team=OuterRef('pk')).order_by()
+        .values('team').annotate(count=Count('id')).values('count')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('teams', '0004_message_team_id_idx_invitation_status_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_member_count, migrations.RunPython.noop),
+    ]
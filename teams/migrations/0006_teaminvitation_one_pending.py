@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:10
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def decline_duplicate_pending(apps, schema_editor):
+    """Оставляет ожидающей только самую новую заявку в паре (команда, участник).
+
+    Более ранние дубли не удаляются, а помечаются отклонёнными
+    (is_accepted=False): их видно в админке, и ограничение ниже их не касается.
+    """
+    TeamInvitation = apps.get_model('teams', 'TeamInvitation')
+    pending = TeamInvitation.objects.filter(is_accepted__isnull=True)
+    keep_ids = pending.values('team', 'invited_user').annotate(keep_id=Max('id')).values('keep_id')
+    pending.exclude(id__in=keep_ids).update(is_accepted=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0005_team_member_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(decline_duplicate_pending, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='teaminvitation',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('is_accepted__isnull', True)),
+                fields=('team', 'invited_user'),
+                name='teams_invite_one_pending',
+            ),
+        ),
+    ]
@@ -1,6 +1,18 @@
 from django.db import models
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.db.models.functions import Greatest
 from django.conf import settings
 
+class TeamQuerySet(models.QuerySet):
+    def with_open_slots(self):
+        """has_open_slots в том же запросе: шаблонам и админке не нужен is_full()"""
+        return self.annotate(has_open_slots=ExpressionWrapper(
+            Q(member_count__lt=F('max_members')), output_field=BooleanField()
+        ))
+    
+    def open(self):
+        return self.filter(member_count__lt=F('max_members'))
+
 class Team(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
@@ -9,15 +21,33 @@ class Team(models.Model):
     max_members = models.IntegerField(default=4)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    # Число участников без COUNT: меняется в путях вступления и выхода,
+    # расхождения исправляет manage.py reconcile_counters
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = TeamQuerySet.as_manager()
     
     def __str__(self):
         return self.name
     
-    def member_count(self):
-        return self.members.count()
-    
     def is_full(self):
-        return self.member_count() >= self.max_members
+        return self.member_count >= self.max_members
+    
+    @classmethod
+    def change_member_count(cls, team_id, delta):
+        cls.objects.filter(id=team_id).update(member_count=Greatest(F('member_count') + delta, 0))
+    
+    @classmethod
+    def claim_slot(cls, team_id):
+        """Занимает место в команде одним условным UPDATE, False - мест нет.
+        
+        Проверка и увеличение member_count атомарны: блокируется только строка
+        этой команды до конца транзакции, параллельные вступления в неё ждут
+        и видят уже увеличенный счётчик.
+        """
+        return cls.objects.filter(id=team_id, member_count__lt=F('max_members')).update(
+            member_count=F('member_count') + 1
+        ) == 1
 
 class TeamInvitation(models.Model):
     id = models.AutoField(primary_key=True)
@@ -28,6 +58,19 @@ class TeamInvitation(models.Model):
     is_accepted = models.BooleanField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Заявки команды по статусу (ожидающие - is_accepted IS NULL)
+            models.Index(fields=['team', 'is_accepted'], name='teams_invite_team_status_idx'),
+        ]
+        constraints = [
+            # Повторные запросы на вступление не плодят ожидающие заявки
+            models.UniqueConstraint(
+                fields=['team', 'invited_user'], condition=Q(is_accepted__isnull=True),
+                name='teams_invite_one_pending',
+            ),
+        ]
+    
     def __str__(self):
         return f"Invitation to {self.invited_user.username} for {self.team.name}"
 
@@ -45,6 +88,18 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Курсорная выборка чата: WHERE team_id = ? ORDER BY id
+            models.Index(fields=['team', 'id'], name='teams_msg_team_id_idx'),
+        ]
         
     def get_author_display_name(self):
-        return self.author.get_full_name() or self.author.username
\ No newline at end of file
+        return self.author.get_full_name() or self.author.username
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'author': self.get_author_display_name(),
+            'content': self.content,
+            'created_at': self.created_at.strftime("%H:%M"),
+        }
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import Profile, User
+from chat.fragments import message_fragments
+from .models import Message, Team, TeamInvitation
+from .snapshot import team_snapshots
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    if not created:
+        message_fragments.invalidate(('teams', instance.id))
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    message_fragments.invalidate(('teams', instance.id))
+
+
+def invalidate_snapshots(invalidate):
+    # Сразу и ещё раз после коммита: до коммита параллельный запрос
+    # может построить снимок из ещё не изменённых данных
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def team_changed(sender, instance, **kwargs):
+    invalidate_snapshots(lambda: team_snapshots.invalidate(instance.id))
+
+
+@receiver(post_save, sender=TeamInvitation)
+@receiver(post_delete, sender=TeamInvitation)
+def invitation_changed(sender, instance, **kwargs):
+    invalidate_snapshots(lambda: team_snapshots.invalidate(instance.team_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_snapshots(lambda: team_snapshots.invalidate_user(instance.id, instance.team_id))
+
+
+@receiver(post_delete, sender=User)
+def member_deleted(sender, instance, **kwargs):
+    # Вступление и выход меняют счётчик сами, удаление участника - здесь.
+    # Вместе с лидером удаляется и команда, тогда UPDATE ничего не найдёт
+    if instance.team_id:
+        Team.change_member_count(instance.team_id, -1)
+
+
+@receiver(post_save, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_snapshots(lambda: team_snapshots.invalidate_user(instance.user_id))
+
+
+@receiver(m2m_changed, sender=User.skill_tags.through)
+def skill_tags_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, User):
+        invalidate_snapshots(lambda: team_snapshots.invalidate_user(instance.id))
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+
+from accounts.models import User
+from .models import Team, TeamInvitation
+
+
+class TeamSnapshot:
+    """Всё, что показывают страница команды и чат: команда с лидером,
+    участники с профилями и навыками, ожидающие заявки.
+
+    Только для чтения: объекты общие для всех запросов процесса.
+    """
+
+    __slots__ = ('team', 'members', 'pending_invitations', 'user_ids', 'built_at')
+
+    def __init__(self, team):
+        self.team = team
+        self.members = list(team.members.all())
+        self.pending_invitations = team.pending_invitations
+        # Все, чьи данные попали в снимок: участники и авторы заявок
+        self.user_ids = frozenset(
+            [member.id for member in self.members]
+            + [invitation.invited_user_id for invitation in self.pending_invitations]
+        )
+        self.built_at = time.monotonic()
+
+    @property
+    def leader(self):
+        return self.team.leader
+
+    @property
+    def member_count(self):
+        return self.team.member_count
+
+    @property
+    def is_full(self):
+        return self.team.is_full()
+
+    @classmethod
+    def build(cls, team_id):
+        """Снимок за четыре запроса (команда, участники, навыки, заявки) или None"""
+        team = Team.objects.select_related('leader').prefetch_related(
+            Prefetch('members', queryset=User.objects.select_related('profile').prefetch_related('skill_tags').order_by('id')),
+            Prefetch(
+                'invitations', to_attr='pending_invitations',
+                queryset=TeamInvitation.objects.filter(is_accepted=None).select_related('invited_user').order_by('id'),
+            ),
+        ).filter(id=team_id).first()
+        return cls(team) if team is not None else None
+
+
+class TeamSnapshotCache:
+    """Снимки команд в памяти процесса (LRU).
+
+    Сигналы сбрасывают снимок после коммита изменений команды, её участников
+    и заявок; изменения из других процессов становятся видны не позже чем
+    через max_age секунд.
+    """
+
+    def __init__(self, max_entries, max_age):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, team_id):
+        """Снимок команды или None, если её нет"""
+        with self._lock:
+            snapshot = self._snapshots.get(team_id)
+            if snapshot is not None and time.monotonic() - snapshot.built_at < self.max_age:
+                self._snapshots.move_to_end(team_id)
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            generation = self._generations.get(team_id, 0)
+
+        snapshot = TeamSnapshot.build(team_id)
+        with self._lock:
+            # Сброс во время построения: снимок мог прочитать старые данные
+            if snapshot is not None and self._generations.get(team_id, 0) == generation:
+                self._snapshots[team_id] = snapshot
+                self._snapshots.move_to_end(team_id)
+                while len(self._snapshots) > self.max_entries:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, *team_ids):
+        with self._lock:
+            for team_id in team_ids:
+                if team_id is not None:
+                    self._snapshots.pop(team_id, None)
+                    self._generations[team_id] = self._generations.get(team_id, 0) + 1
+
+    def invalidate_on_commit(self, *team_ids):
+        """Для записей мимо сигналов (update, bulk_update): сразу и после коммита"""
+        self.invalidate(*team_ids)
+        transaction.on_commit(lambda: self.invalidate(*team_ids))
+
+    def invalidate_user(self, user_id, team_id=None):
+        """Сброс команды пользователя и всех снимков, где он упоминается"""
+        with self._lock:
+            team_ids = [key for key, snapshot in self._snapshots.items() if user_id in snapshot.user_ids]
+        self.invalidate(team_id, *team_ids)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._generations.clear()
+
+
+team_snapshots = TeamSnapshotCache(
+    max_entries=settings.TEAM_SNAPSHOT_CACHE_SIZE,
+    max_age=settings.TEAM_SNAPSHOT_MAX_AGE,
+)
@@ -1,3 +1,466 @@
-from django.test import TestCase
+import contextlib
+import io
+import queue
+import shutil
+import tempfile
+import threading
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import User
+from hackathon_site.ratelimit import limiter
+from hackathon_site.testing import QueryPlanAssertionsMixin
+from .models import Message, Team, TeamInvitation
+from .snapshot import team_snapshots
+from .views import accept_invitation
+
+
+class TeamsQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """Горячие запросы команд не должны деградировать до полного сканирования"""
+
+    def test_chat_newest_page(self):
+        self.assertUsesIndex(Message.objects.filter(team_id=1).order_by('-id')[:51], ordered=True)
+
+    def test_chat_messages_after_cursor(self):
+        queryset = Message.objects.filter(team_id=1, id__gt=100).order_by('id')[:51]
+        self.assertUsesIndex(queryset, ordered=True)
+
+    def test_pending_invitations(self):
+        self.assertUsesIndex(TeamInvitation.objects.filter(team_id=1, is_accepted=None))
+
+
+class TeamChatApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', password='pass', first_name='Анна')
+        cls.team = Team.objects.create(name='Alpha', leader=cls.leader)
+        cls.member = User.objects.create_user('member', password='pass', team=cls.team)
+        cls.leader.team = cls.team
+        cls.leader.save()
+
+    def test_messages_have_per_user_is_own(self):
+        Message.objects.create(team=self.team, author=self.leader, content='Привет')
+        Message.objects.create(team=self.team, author=self.member, content='Здравствуйте')
+        self.client.force_login(self.member)
+
+        data = self.client.get(reverse('teams:get_messages', args=[self.team.id])).json()
+
+        self.assertEqual(
+            [(m['author'], m['content'], m['is_own']) for m in data['messages']],
+            [('Анна', 'Привет', False), ('member', 'Здравствуйте', True)]
+        )
+        self.assertFalse(data['has_more'])
+
+    @override_settings(RATE_LIMITS={'send': {'user': (1, 1)}})
+    def test_send_is_rate_limited(self):
+        limiter.reset()
+        self.client.force_login(self.member)
+        url = reverse('teams:send_message')
+
+        first = self.client.post(url, {'content': 'раз', 'team_id': self.team.id}, content_type='application/json')
+        second = self.client.post(url, {'content': 'два', 'team_id': self.team.id}, content_type='application/json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second['Retry-After'], '1')
+
+    def test_archived_history_keeps_is_own(self):
+        Message.objects.create(team=self.team, author=self.leader, content='Старое')
+        Message.objects.create(team=self.team, author=self.member, content='Тоже старое')
+        archive_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_root, ignore_errors=True)
+        self.client.force_login(self.member)
+
+        with override_settings(CHAT_ARCHIVE_ROOT=archive_root):
+            call_command('archive_chat_history', days=0, stdout=io.StringIO())
+            recent = Message.objects.create(team=self.team, author=self.leader, content='Новое')
+            data = self.client.get(reverse('teams:get_messages', args=[self.team.id])).json()
+
+        self.assertEqual(Message.objects.get().id, recent.id)
+        self.assertEqual(
+            [(m['content'], m['is_own']) for m in data['messages']],
+            [('Старое', False), ('Тоже старое', True), ('Новое', False)]
+        )
+
+
+class TeamMemberCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', password='pass')
+        cls.user = User.objects.create_user('user', password='pass')
+
+    def test_create_accept_and_leave_maintain_member_count(self):
+        self.client.force_login(self.leader)
+        self.client.post(reverse('teams:create'), {'name': 'Alpha', 'description': '', 'max_members': 4})
+        team = Team.objects.get(name='Alpha')
+        self.assertEqual(team.member_count, 1)
+
+        invitation = TeamInvitation.objects.create(team=team, invited_user=self.user, invited_by=self.leader)
+        self.client.get(reverse('teams:accept_invitation', args=[invitation.id]))
+        team.refresh_from_db()
+        self.assertEqual(team.member_count, 2)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('teams:leave', args=[team.id]))
+        team.refresh_from_db()
+        self.assertEqual(team.member_count, 1)
+
+    def test_deleting_member_decrements_member_count(self):
+        team = Team.objects.create(name='Alpha', leader=self.leader, member_count=2)
+        User.objects.filter(id__in=[self.leader.id, self.user.id]).update(team=team)
+        User.objects.get(id=self.user.id).delete()
+        team.refresh_from_db()
+        self.assertEqual(team.member_count, 1)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_team_is_read_only_in_user_admin(self):
+        admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:accounts_user_change', args=[self.user.id]))
+        self.assertNotIn('team', response.context['adminform'].form.fields)
+
+
+class TeamCapacityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', password='pass')
+        cls.team = Team.objects.create(name='Alpha', leader=cls.leader, max_members=2, member_count=1)
+        cls.leader.team = cls.team
+        cls.leader.save()
+        cls.users = [User.objects.create_user(f'user{i}', password='pass') for i in range(2)]
+
+    def invite(self, user, team=None):
+        team = team or self.team
+        return TeamInvitation.objects.create(team=team, invited_user=user, invited_by=team.leader)
+
+    def accept(self, invitation):
+        self.client.force_login(invitation.team.leader)
+        self.client.get(reverse('teams:accept_invitation', args=[invitation.id]))
+        invitation.refresh_from_db()
+
+    def test_claim_slot_stops_at_max_members(self):
+        self.assertTrue(Team.claim_slot(self.team.id))
+        self.assertFalse(Team.claim_slot(self.team.id))
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.member_count, 2)
+
+    def test_claim_slot_on_full_team_is_one_conditional_update(self):
+        Team.objects.filter(id=self.team.id).update(member_count=2)
+        for attempt in range(2):
+            with self.assertNumQueries(1) as queries:
+                self.assertFalse(Team.claim_slot(self.team.id))
+            self.assertTrue(queries.captured_queries[0]['sql'].startswith('UPDATE'))
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.member_count, 2)
+
+    def test_accept_into_full_team_changes_nothing(self):
+        first, second = self.invite(self.users[0]), self.invite(self.users[1])
+        self.accept(first)
+        self.accept(second)
+
+        self.assertTrue(first.is_accepted)
+        self.assertIsNone(second.is_accepted)
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.member_count, 2)
+        self.assertEqual(list(self.team.members.order_by('id')), [self.leader, self.users[0]])
+
+    def test_stale_accept_does_not_move_user_twice(self):
+        other_leader = User.objects.create_user('other', password='pass')
+        other = Team.objects.create(name='Beta', leader=other_leader, max_members=2, member_count=1)
+        first, second = self.invite(self.users[0]), self.invite(self.users[0], other)
+        # Вторая заявка загружена до того, как участник вступил в первую команду
+        stale = TeamInvitation.objects.select_related('team', 'invited_user').get(pk=second.pk)
+        self.accept(first)
+
+        self.assertEqual(accept_invitation(stale), 'Участник уже перешёл в другую команду')
+        second.refresh_from_db()
+        other.refresh_from_db()
+        self.assertIsNone(second.is_accepted)
+        self.assertEqual(other.member_count, 1)
+
+    def test_repeated_join_keeps_one_pending_invitation(self):
+        self.client.force_login(self.users[0])
+        self.client.get(reverse('teams:join', args=[self.team.id]))
+        self.client.get(reverse('teams:join', args=[self.team.id]))
+        self.assertEqual(TeamInvitation.objects.filter(invited_user=self.users[0]).count(), 1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TeamSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', password='pass', skills='Python')
+        cls.team = Team.objects.create(name='Alpha', leader=cls.leader, member_count=2)
+        cls.leader.team = cls.team
+        cls.leader.save()
+        cls.member = User.objects.create_user('member', password='pass', team=cls.team, skills='Figma')
+        cls.applicant = User.objects.create_user('applicant', password='pass')
+        cls.invitation = TeamInvitation.objects.create(team=cls.team, invited_user=cls.applicant, invited_by=cls.leader)
+
+    def setUp(self):
+        team_snapshots.clear()
+
+    def detail_page(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('teams:detail', args=[self.team.id]))
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries]
+
+    def test_repeated_renders_hit_the_snapshot(self):
+        response, first = self.detail_page(self.member)
+        self.assertEqual([m.username for m in response.context['members']], ['leader', 'member'])
+        self.assertContains(response, 'Figma')
+
+        response, second = self.detail_page(self.member)
+        self.assertEqual(len(first) - len(second), 4)
+        self.assertFalse([sql for sql in second if 'teams_team' in sql or 'accounts_skill' in sql])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('chat:team_chat', args=[self.team.id])).status_code, 200)
+        self.assertFalse([q for q in queries if 'teams_team' in q['sql']])
+
+    def test_membership_and_profile_changes_invalidate(self):
+        self.detail_page(self.member)
+        self.client.force_login(self.leader)
+        self.client.get(reverse('teams:accept_invitation', args=[self.invitation.id]))
+        response, _ = self.detail_page(self.member)
+        self.assertEqual(len(response.context['members']), 3)
+        self.assertEqual(response.context['pending_invitations'], [])
+        self.assertEqual(response.context['team'].member_count, 3)
+
+        self.client.get(reverse('teams:leave', args=[self.team.id]))
+        response, _ = self.detail_page(self.leader)
+        self.assertEqual([m.username for m in response.context['members']], ['leader', 'applicant'])
+        self.assertEqual(response.context['team'].member_count, 2)
+
+        self.applicant.refresh_from_db()
+        self.applicant.skills = 'Go'
+        self.applicant.save()
+        response, _ = self.detail_page(self.applicant)
+        self.assertContains(response, '>Go<')
+
+    def test_missing_team_is_404(self):
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(reverse('teams:detail', args=[self.team.id + 100])).status_code, 404)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BulkInvitationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', password='pass')
+        cls.team = Team.objects.create(name='Alpha', leader=cls.leader, max_members=3, member_count=1)
+        cls.leader.team = cls.team
+        cls.leader.save()
+        other_leader = User.objects.create_user('other', password='pass')
+        cls.other = Team.objects.create(name='Beta', leader=other_leader, max_members=3, member_count=2)
+        other_leader.team = cls.other
+        other_leader.save()
+        # Последний кандидат уходит из Beta
+        cls.applicants = [User.objects.create_user(f'user{i}', password='pass') for i in range(3)]
+        cls.applicants.append(User.objects.create_user('mover', password='pass', team=cls.other))
+        cls.invitations = [
+            TeamInvitation.objects.create(team=cls.team, invited_user=user, invited_by=cls.leader)
+            for user in cls.applicants
+        ]
+        cls.foreign = TeamInvitation.objects.create(team=cls.other, invited_user=cls.applicants[0], invited_by=other_leader)
+
+    def post_json(self, action, ids):
+        response = self.client.post(
+            reverse('teams:bulk_invitations'), {'action': action, 'invitation_ids': ids},
+            content_type='application/json',
+        )
+        return {row['id']: row['outcome'] for row in response.json()['results']}
+
+    def test_accept_fills_free_slots_once_per_team(self):
+        self.invitations[2].is_accepted = False
+        self.invitations[2].save()
+        self.client.force_login(self.leader)
+        ids = [self.invitations[3].id, self.invitations[0].id, self.invitations[1].id, self.invitations[2].id]
+
+        with CaptureQueriesContext(connection) as queries:
+            outcomes = self.post_json('accept', ids + [self.foreign.id, 999999])
+
+        self.assertEqual(outcomes, {
+            self.invitations[0].id: 'accepted',
+            self.invitations[1].id: 'accepted',
+            self.invitations[2].id: 'already_processed',
+            self.invitations[3].id: 'team_full',
+            self.foreign.id: 'forbidden',
+            999999: 'not_found',
+        })
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.member_count, 3)
+        self.assertEqual(set(self.team.members.all()), {self.leader, *self.applicants[:2]})
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE "teams_', 'UPDATE "accounts_user"'))]
+        self.assertEqual(len(writes), 3, writes)
+
+    def test_accept_moves_user_and_updates_both_counters(self):
+        self.client.force_login(self.leader)
+        self.assertEqual(self.post_json('accept', [self.invitations[3].id]), {self.invitations[3].id: 'accepted'})
+        self.team.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.team.member_count, self.other.member_count), (2, 1))
+
+    def test_organizer_accepts_one_invitation_per_user(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+        outcomes = self.post_json('accept', [self.invitations[0].id, self.foreign.id])
+        self.assertEqual(outcomes, {self.invitations[0].id: 'accepted', self.foreign.id: 'user_taken'})
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.member_count, 2)
+
+    def test_form_decline_reports_summary(self):
+        self.client.force_login(self.leader)
+        response = self.client.post(reverse('teams:bulk_invitations'), {
+            'action': 'decline', 'team': self.team.id,
+            'invitation_ids': [self.invitations[0].id, self.invitations[1].id],
+        }, follow=True)
+        self.assertRedirects(response, reverse('teams:detail', args=[self.team.id]))
+        self.assertEqual([str(m) for m in response.context['messages']], ['Отклонено: 2'])
+        self.assertEqual(TeamInvitation.objects.filter(is_accepted=False).count(), 2)
+
+    def test_admin_actions(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+        response = self.client.post(reverse('admin:teams_teaminvitation_changelist'), {
+            'action': 'accept_invitations',
+            '_selected_action': [invitation.id for invitation in self.invitations[:3]],
+        }, follow=True)
+        self.assertEqual([str(m) for m in response.context['messages']], ['Принято: 2, Команда заполнена: 1'])
+
+
+class TeamCapacityConcurrencyTests(TransactionTestCase):
+    """Сотни одновременных вступлений и принятий заявок в немногие команды.
+
+    SQLite не пишет из нескольких соединений сразу: там запросы потоков
+    выполняются по одному, но в том порядке, в каком потоки их успели взять.
+    """
+    TEAMS = 10
+    MAX_MEMBERS = 5
+    APPLICANTS = 200
+    WORKERS = 40
+
+    def setUp(self):
+        self.teams = []
+        for i in range(self.TEAMS):
+            leader = User.objects.create_user(f'leader{i}', password='pass')
+            team = Team.objects.create(name=f'Team {i}', leader=leader, max_members=self.MAX_MEMBERS, member_count=1)
+            leader.team = team
+            leader.save()
+            self.teams.append(team)
+        # Без пароля: force_login он не нужен, а хеширование двухсот паролей небыстрое
+        self.applicants = [User.objects.create_user(f'user{i}') for i in range(self.APPLICANTS)]
+        self.request_lock = threading.Lock() if connection.vendor == 'sqlite' else contextlib.nullcontext()
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def run_concurrently(self, tasks):
+        """Выполняет (client, url) в WORKERS потоках"""
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+        barrier = threading.Barrier(self.WORKERS + 1)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        client, url = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    with self.request_lock:
+                        response = client.get(url)
+                    if response.status_code != 302:
+                        errors.append((url, response.status_code))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_joins_and_accepts_never_overfill_teams(self):
+        # Каждый участник дважды просится в свою команду: 20 претендентов на 4 места
+        join_tasks = []
+        for i, user in enumerate(self.applicants):
+            url = reverse('teams:join', args=[self.teams[i % self.TEAMS].id])
+            join_tasks += [(self.client_for(user), url), (self.client_for(user), url)]
+        self.run_concurrently(join_tasks)
+        self.assertEqual(TeamInvitation.objects.count(), self.APPLICANTS)
+
+        accept_tasks = [
+            (self.client_for(invitation.team.leader), reverse('teams:accept_invitation', args=[invitation.id]))
+            for invitation in TeamInvitation.objects.select_related('team__leader')
+        ]
+        self.run_concurrently(accept_tasks)
+
+        for team in Team.objects.all():
+            self.assertEqual(team.member_count, self.MAX_MEMBERS)
+            self.assertEqual(team.members.count(), self.MAX_MEMBERS)
+            self.assertEqual(team.invitations.filter(is_accepted=True).count(), self.MAX_MEMBERS - 1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TeamListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teams = []
+        for i in range(15):
+            leader = User.objects.create_user(f'leader{i}', password='pass')
+            cls.teams.append(Team.objects.create(
+                name=f'Team {i}', leader=leader, max_members=2, member_count=2 if i % 3 == 0 else 1
+            ))
+
+    def list_ids(self, **params):
+        response = self.client.get(reverse('teams:list'), params)
+        return [team.id for team in response.context['teams']], response.context['next_cursor']
+
+    def test_keyset_pages_cover_all_teams(self):
+        ids, cursor = self.list_ids()
+        self.assertEqual(len(ids), 12)
+        rest, last_cursor = self.list_ids(before=cursor)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(ids + rest, [team.id for team in reversed(self.teams)])
+
+    def test_filters(self):
+        ids, cursor = self.list_ids(open='1')
+        self.assertEqual(ids, [team.id for team in reversed(self.teams) if team.member_count < 2])
+        self.assertIsNone(cursor)
+        self.assertEqual(self.list_ids(q='team 1')[0], [team.id for team in reversed(self.teams[10:])] + [self.teams[1].id])
+
+    def test_query_count_does_not_depend_on_team_count(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('teams:list'))
+            self.assertContains(response, 'Есть места')
+            self.assertContains(response, 'Команда заполнена')
+            return len(queries)
+
+        baseline = count_queries()
+        Team.objects.filter(id__in=[team.id for team in self.teams[:6]]).update(member_count=0)
+        self.assertEqual(count_queries(), baseline)
+        self.assertEqual(baseline, 1)
+
+    def test_admin_changelist_shows_open_slots(self):
+        admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:teams_team_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Есть места')
+        self.assertFalse([q for q in queries if 'COUNT' in q['sql'] and 'accounts_user' in q['sql']])
@@ -13,6 +13,7 @@ urlpatterns = [
     path('<int:pk>/leave/', views.TeamLeaveView, name='leave'),
     path('invite/<int:invitation_id>/accept/', views.InvitationAcceptView, name='accept_invitation'),
     path('invite/<int:invitation_id>/decline/', views.InvitationDeclineView, name='decline_invitation'),
+    path('invite/bulk/', views.InvitationBulkView, name='bulk_invitations'),
     
     # URL для чата
     path('<int:pk>/chat/', views.team_chat, name='chat'),
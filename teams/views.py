@@ -5,21 +5,62 @@ from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
 import json
+import logging
 
+from accounts.matching import skill_matcher
+from accounts.models import User
+from chat.archive import RoomArchive
+from chat.fragments import messages_response, team_message_fragment, with_is_own
+from chat.pagination import get_cursor_page, parse_cursor
+from hackathon_site.ratelimit import rate_limit
+from .invitations import process_invitations, summarize
 from .models import Team, TeamInvitation, Message
+from .snapshot import team_snapshots
 from .forms import TeamCreateForm, TeamUpdateForm
 
+logger = logging.getLogger(__name__)
+
 class TeamListView(ListView):
+    """Активные команды, новые первыми, курсором по id без OFFSET и COUNT.
+    
+    Фильтры: q - часть названия, open=1 - только команды со свободными местами.
+    """
     model = Team
     template_name = 'teams/team_list.html'
     context_object_name = 'teams'
+    page_size = 12
+    
+    def get_filters(self):
+        return {
+            'q': self.request.GET.get('q', '').strip(),
+            'open': self.request.GET.get('open') == '1',
+        }
     
     def get_queryset(self):
-        return Team.objects.filter(is_active=True).select_related('leader')
+        filters = self.get_filters()
+        queryset = Team.objects.filter(is_active=True).with_open_slots().select_related('leader')
+        if filters['q']:
+            queryset = queryset.filter(name__icontains=filters['q'])
+        if filters['open']:
+            queryset = queryset.open()
+        before_id = self.request.GET.get('before', '')
+        if before_id.isdigit():
+            queryset = queryset.filter(id__lt=int(before_id))
+        
+        teams = list(queryset.order_by('-id')[:self.page_size + 1])
+        self.next_cursor = teams[self.page_size - 1].id if len(teams) > self.page_size else None
+        return teams[:self.page_size]
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filters'] = self.get_filters()
+        context['next_cursor'] = self.next_cursor
+        return context
 
 class TeamCreateView(LoginRequiredMixin, CreateView):
     model = Team
@@ -29,9 +70,13 @@ class TeamCreateView(LoginRequiredMixin, CreateView):
     
     def form_valid(self, form):
         form.instance.leader = self.request.user
-        response = super().form_valid(form)
-        self.request.user.team = self.object
-        self.request.user.save()
+        with transaction.atomic():
+            response = super().form_valid(form)
+            if self.request.user.team_id:
+                Team.change_member_count(self.request.user.team_id, -1)
+            self.request.user.team = self.object
+            self.request.user.save()
+            Team.change_member_count(self.object.id, 1)
         return response
 
 class TeamDetailView(LoginRequiredMixin, DetailView):
@@ -39,14 +84,21 @@ class TeamDetailView(LoginRequiredMixin, DetailView):
     template_name = 'teams/team_detail.html'
     context_object_name = 'team'
     
+    def get_object(self, queryset=None):
+        # Команда, участники и заявки из кэшированного снимка
+        self.snapshot = team_snapshots.get(self.kwargs['pk'])
+        if self.snapshot is None:
+            raise Http404('Команда не найдена')
+        return self.snapshot.team
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_member'] = self.request.user.team == self.object
-        context['is_leader'] = self.object.leader == self.request.user
-        context['pending_invitations'] = TeamInvitation.objects.filter(
-            team=self.object, 
-            is_accepted=None
-        )
+        context['is_member'] = self.request.user.team_id == self.object.id
+        context['is_leader'] = self.object.leader_id == self.request.user.id
+        context['pending_invitations'] = self.snapshot.pending_invitations
+        context['members'] = self.snapshot.members
+        if context['is_leader'] and not self.object.is_full():
+            context['recommended_members'] = skill_matcher.members_for_team(self.object.id)
         return context
 
 class TeamUpdateView(LoginRequiredMixin, UpdateView):
@@ -70,10 +122,12 @@ def TeamJoinView(request, pk):
         messages.error(request, 'Вы уже состоите в команде')
         return redirect('teams:detail', pk=team.pk)
     
+    # Место окончательно занимается при принятии заявки, здесь - только подсказка
     if team.is_full():
         messages.error(request, 'Команда уже заполнена')
         return redirect('teams:detail', pk=team.pk)
     
+    # Одновременные запросы упираются в teams_invite_one_pending, get_or_create вернёт существующую
     invitation, created = TeamInvitation.objects.get_or_create(
         team=team,
         invited_user=request.user,
@@ -100,35 +154,62 @@ def TeamLeaveView(request, pk):
         messages.error(request, 'Лидер команды не может покинуть команду. Сначала передайте лидерство.')
         return redirect('teams:detail', pk=team.pk)
     
-    request.user.team = None
-    request.user.save()
+    with transaction.atomic():
+        request.user.team = None
+        request.user.save()
+        Team.change_member_count(team.id, -1)
     messages.success(request, 'Вы покинули команду')
     return redirect('teams:list')
 
 @login_required
 def InvitationAcceptView(request, invitation_id):
-    invitation = get_object_or_404(TeamInvitation, pk=invitation_id)
+    invitation = get_object_or_404(TeamInvitation.objects.select_related('team', 'invited_user'), pk=invitation_id)
     
-    if invitation.team.leader != request.user:
+    if invitation.team.leader_id != request.user.id:
         messages.error(request, 'Только лидер команды может принимать приглашения')
         return redirect('teams:detail', pk=invitation.team.pk)
     
-    if invitation.is_accepted is not None:
-        messages.error(request, 'Приглашение уже обработано')
-        return redirect('teams:detail', pk=invitation.team.pk)
-    
-    if invitation.team.is_full():
-        messages.error(request, 'Команда уже заполнена')
-        return redirect('teams:detail', pk=invitation.team.pk)
+    error = accept_invitation(invitation)
+    if error:
+        messages.error(request, error)
+    else:
+        messages.success(request, f'{invitation.invited_user.username} присоединился к команде')
+    return redirect('teams:detail', pk=invitation.team.pk)
+
+def accept_invitation(invitation):
+    """Принимает заявку, возвращает текст ошибки или None.
     
+    Все проверки - условные UPDATE внутри транзакции, а не чтения до неё:
+    заявка принимается один раз, место в команде занимается только если
+    оно есть (Team.claim_slot), участник переходит, только если за это
+    время не вступил в другую команду. Блокируются лишь строки заявки,
+    участника и затронутых команд; команды - в порядке id, чтобы встречные
+    переходы между двумя командами не взаимоблокировались.
+    """
+    team_id = invitation.team_id
+    old_team_id = invitation.invited_user.team_id
     with transaction.atomic():
-        invitation.is_accepted = True
-        invitation.save()
-        invitation.invited_user.team = invitation.team
-        invitation.invited_user.save()
-    
-    messages.success(request, f'{invitation.invited_user.username} присоединился к команде')
-    return redirect('teams:detail', pk=invitation.team.pk)
+        if not TeamInvitation.objects.filter(pk=invitation.pk, is_accepted=None).update(is_accepted=True):
+            return 'Приглашение уже обработано'
+        team_snapshots.invalidate_on_commit(team_id, old_team_id)
+        if old_team_id == team_id:
+            return None
+        
+        for locked_team_id in sorted(filter(None, {team_id, old_team_id})):
+            if locked_team_id == old_team_id:
+                Team.change_member_count(old_team_id, -1)
+            elif not Team.claim_slot(team_id):
+                transaction.set_rollback(True)
+                return 'Команда уже заполнена'
+        
+        moved = User.objects.filter(pk=invitation.invited_user_id, team_id=old_team_id).update(team_id=team_id)
+        if not moved:
+            transaction.set_rollback(True)
+            return 'Участник уже перешёл в другую команду'
+        transaction.on_commit(skill_matcher.invalidate)
+    invitation.is_accepted = True
+    invitation.invited_user.team_id = team_id
+    return None
 
 @login_required
 def InvitationDeclineView(request, invitation_id):
@@ -143,8 +224,57 @@ def InvitationDeclineView(request, invitation_id):
     messages.success(request, f'Приглашение для {invitation.invited_user.username} отклонено')
     return redirect('teams:detail', pk=invitation.team.pk)
 
+@login_required
+@require_POST
+def InvitationBulkView(request):
+    """Принять или отклонить много заявок одним запросом.
+    
+    JSON {"action": "accept" | "decline", "invitation_ids": [...]} - ответ JSON
+    с исходом по каждой заявке. Форма со страницы команды - сводка сообщением
+    и возврат на страницу. Лидер обрабатывает заявки своих команд,
+    организатор (is_staff) - любые.
+    """
+    is_json = request.content_type == 'application/json'
+    team_id = request.POST.get('team', '')
+    back = redirect('teams:detail', pk=int(team_id)) if team_id.isdigit() else redirect('teams:list')
+    
+    def error(text):
+        if is_json:
+            return JsonResponse({'error': text}, status=400)
+        messages.error(request, text)
+        return back
+    
+    try:
+        if is_json:
+            data = json.loads(request.body)
+            action, raw_ids = data.get('action'), data.get('invitation_ids', [])
+        else:
+            action, raw_ids = request.POST.get('action'), request.POST.getlist('invitation_ids')
+        invitation_ids = list(dict.fromkeys(int(invitation_id) for invitation_id in raw_ids))
+    except (ValueError, TypeError, AttributeError):
+        return error('Неверный формат данных')
+    
+    if action not in ('accept', 'decline'):
+        return error('Неизвестное действие')
+    if not invitation_ids:
+        return error('Не выбрано ни одной заявки')
+    if len(invitation_ids) > settings.TEAM_BULK_INVITATIONS_MAX:
+        return error(f'Не больше {settings.TEAM_BULK_INVITATIONS_MAX} заявок за раз')
+    
+    outcomes = process_invitations(
+        invitation_ids, accept=action == 'accept', leader=None if request.user.is_staff else request.user
+    )
+    if is_json:
+        return JsonResponse({
+            'results': [{'id': invitation_id, 'outcome': outcome} for invitation_id, outcome in outcomes.items()],
+        })
+    
+    messages.info(request, summarize(outcomes))
+    return back
+
 @login_required
 @require_GET
+@rate_limit('poll')
 def get_messages(request, team_id):
     """API для получения сообщений чата"""
     try:
@@ -154,30 +284,39 @@ def get_messages(request, team_id):
         if request.user.team != team:
             return JsonResponse({'error': 'Вы не состоите в этой команде'}, status=403)
         
-        # Пытаемся получить сообщения
+        # Пытаемся получить сообщения (последние limit или по курсору before_id/after_id)
         try:
-            messages_list = Message.objects.filter(team=team).select_related('author').order_by('created_at')
+            before_id, after_id, limit = parse_cursor(request.GET)
+            messages_list, has_more = get_cursor_page(
+                Message.objects.filter(team=team).select_related('author'),
+                before_id=before_id, after_id=after_id, limit=limit
+            )
             
-            messages_data = []
-            for msg in messages_list:
-                messages_data.append({
-                    'id': msg.id,
-                    'author': msg.author.get_full_name() or msg.author.username,
-                    'content': msg.content,
-                    'created_at': msg.created_at.strftime("%H:%M"),
-                    'is_own': msg.author == request.user,
-                })
+            # Готовый JSON сообщений берём из кэша фрагментов
+            rows = [
+                (msg.id, msg.author_id, team_message_fragment(msg, msg.author_id == request.user.id))
+                for msg in messages_list
+            ]
+            if after_id is None:
+                # Старая история перенесена в архив командой archive_chat_history
+                rows, has_more = RoomArchive('teams', team.id).merge_page(
+                    rows, has_more, before_id, limit,
+                    convert=lambda author_id, fragment: with_is_own(
+                        fragment[:-1], author_id == request.user.id
+                    )
+                )
+            fragments = [fragment for message_id, author_id, fragment in rows]
             
-            print(f"DEBUG: Found {len(messages_data)} messages for team {team_id}")  # Для отладки
-            return JsonResponse({'messages': messages_data})
+            logger.debug('Found %d messages for team %s', len(fragments), team_id)
+            return messages_response(fragments, has_more)
             
         except Exception as e:
             # Если есть проблемы с базой
-            print(f"DEBUG: Error getting messages: {e}")  # Для отладки
+            logger.exception('Error getting messages for team %s', team_id)
             return JsonResponse({'messages': [], 'debug': str(e)})
             
     except Exception as e:
-        print(f"DEBUG: General error: {e}")  # Для отладки
+        logger.exception('Error in get_messages')
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
@@ -190,22 +329,28 @@ def team_chat(request, pk):
         messages.error(request, 'Вы не состоите в этой команде')
         return redirect('teams:detail', pk=team.pk)
     
-    # Получаем сообщения для отображения в шаблоне
+    # Получаем последние сообщения для отображения в шаблоне, историю догружает API
     try:
-        chat_messages = Message.objects.filter(team=team).select_related('author').order_by('created_at')
-    except Exception as e:
+        chat_messages, has_more = get_cursor_page(
+            Message.objects.filter(team=team).select_related('author')
+        )
+        # Более старая история может лежать в архиве
+        has_more = has_more or bool(RoomArchive('teams', team.id).last_id)
+    except Exception:
         # Если таблицы сообщений нет
-        print(f"DEBUG: Error getting messages: {e}")
-        chat_messages = []
+        logger.exception('Error getting messages for team %s', team.id)
+        chat_messages, has_more = [], False
     
     return render(request, 'teams/team_chat.html', {
         'team': team,
         'messages': chat_messages,
+        'has_more': has_more,
     })
 
 @login_required
 @require_POST
 @csrf_exempt
+@rate_limit('send')
 def send_message(request):
     """API для отправки сообщения"""
     try:
@@ -232,16 +377,10 @@ def send_message(request):
             content=content
         )
         
-        return JsonResponse({
-            'success': True,
-            'message': {
-                'id': message.id,
-                'author': message.author.get_full_name() or message.author.username,
-                'content': message.content,
-                'created_at': message.created_at.strftime("%H:%M"),
-                'is_own': True,
-            }
-        })
+        return HttpResponse(
+            b'{"success":true,"message":' + team_message_fragment(message, True) + b'}',
+            content_type='application/json'
+        )
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Неверный формат данных'}, status=400)